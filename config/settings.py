@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'drf_spectacular',
 ]
@@ -86,12 +88,18 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600  # 100MB
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # PostgreSQL with a bounded pool of connections per process, shared by the greenlets of a gevent worker
+        'ENGINE': 'orgdigestor.pooled_postgresql',
         'NAME': 'playground_tables',
         'USER': 'digestor_user',
         'PASSWORD': 'digestor_pass',
         'HOST': 'postgres',
         'PORT': '5432',
+        'OPTIONS': {
+            # (worker replicas + web app) x max_size must stay below Postgres' max_connections (100 by default),
+            # tasks wait up to `timeout` seconds for a connection and are retried after that
+            'pool': {'max_size': 20, 'timeout': 30},
+        },
     },
 }
 
@@ -170,5 +178,35 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Digest chunks are sent with the priority of their job, see `scheduling.job_priority`, other tasks go first.
+# Workers prefetch one message per pool slot, and a gevent worker has as many slots as its --concurrency (500),
+# so priorities only order the messages waiting in the broker beyond that. Chunks queued per job are bounded
+# by its inflight limit instead (see `dispatch_digest_chunks`), that is what keeps a big job from crowding out others.
+CELERY_TASK_QUEUE_MAX_PRIORITY = 9
+CELERY_TASK_DEFAULT_PRIORITY = 9
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    'sweep-digest-jobs': {
+        'task': 'orgdigestor.tasks.sweep_digest_jobs',
+        'schedule': 60.0,
+    },
+}
 
 
+# Orgdigestor Configuration
+DIGEST_DIMENSION_CACHE_SIZE = 10000  # Cached Country/Industry ids per worker process
+DIGEST_DATA_DIR = '/mnt/data/'  # Uploaded files, shared between the Django app and the Celery workers
+DIGEST_CHUNK_STALE_SECONDS = 10 * 60  # Running chunks without a checkpoint for this long and not being written are requeued
+DIGEST_FILE_RETENTION_SECONDS = 24 * 60 * 60  # Files no job needs are deleted after this long
+DIGEST_MAX_STORED_ERRORS = 1_000_000  # Error records kept per job, the rest are only counted
+DIGEST_TARGET_CHUNK_SECONDS = 30  # Jobs without rows_per_task get chunks digested in about this long
+DIGEST_DEFAULT_ROWS_PER_SECOND = 2000  # Chunk throughput assumed until some chunks were measured
+DIGEST_MIN_CHUNKS_PER_JOB = 8  # Files are cut in at least this many chunks, so they are digested in parallel
+DIGEST_CHUNK_ROWS_RANGE = (1000, 200_000)  # Bounds of the rows of an adaptive chunk
+DIGEST_INITIAL_INFLIGHT_CHUNKS = 4  # Chunks of a job queued or running at once when it starts
+DIGEST_MAX_INFLIGHT_CHUNKS = 32  # Chunks of a job queued or running at once at most
+DIGEST_SLOW_CHUNK_FACTOR = 2  # Chunks this many times slower per row than the job's fastest one halve its in-flight chunks
+DIGEST_MAX_LOCK_WAITS = 4  # Sessions waiting on locks above which jobs halve their in-flight chunks
+DIGEST_METRICS_PORT = 9808  # Port of the metrics exporter of each Celery worker, None disables it
+DIGEST_PROFILE_DIR = os.path.join(DIGEST_DATA_DIR, 'profiles')  # Call stacks sampled from profiled chunks
+DIGEST_PROFILE_INTERVAL = 0.005  # CPU seconds between two call stack samples of a profiled chunk
@@ -1,11 +1,13 @@
 from django.urls import path, include
 from rest_framework import routers
 
-from orgdigestor.api_views import OrganizationViewSet
+from orgdigestor.api_views import DigestJobViewSet, OrganizationStatsViewSet, OrganizationViewSet
 
 
 router = routers.DefaultRouter()
 router.register(r'organizations', OrganizationViewSet)
+router.register(r'digest-jobs', DigestJobViewSet)
+router.register(r'organization-stats', OrganizationStatsViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
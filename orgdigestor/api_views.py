@@ -1,28 +1,93 @@
 import os
 import csv
+import io
+import codecs
+import collections
+import itertools
+import shutil
 import uuid
+import zipfile
+import zlib
+from dataclasses import asdict
 from http import HTTPMethod
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.pagination import CursorPagination
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.parsers import BaseParser, FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
-from orgdigestor.models import Organization
-from orgdigestor.serializers import OrganizationSerializer, OrganizationsFileDigestSerializer
-from orgdigestor.tasks import process_organizations_csv
+from orgdigestor.chunking import csv_members, is_gzip_file, is_zip_file
+from orgdigestor.exports import EXPORT_FORMATS, Echo
+from orgdigestor.filters import OrganizationFilterBackend, organization_query
+from orgdigestor.ingestion import (
+    DIGEST_BATCH_ROWS, OrganizationDigestReport, digest_validated_rows, merge_reports, validate_ndjson_lines
+)
+from orgdigestor.metrics import CONTENT_TYPE, count_digest_rows, render_metrics
+from orgdigestor.models import Organization, DigestJob, OrganizationStats
+from orgdigestor.search import search_organizations
+from orgdigestor.serializers import (
+    DigestJobSerializer, OrganizationSearchSerializer, OrganizationSerializer, OrganizationStatsQuerySerializer,
+    OrganizationStatsSerializer, OrganizationsFileDigestSerializer,
+)
+from orgdigestor.stats import organization_stats
+from orgdigestor.tasks import fail_digest_job, process_organizations_csv
+
+# Error records read from the database at a time when streaming an error report
+ERROR_REPORT_CHUNK_SIZE = 2000
+ERROR_REPORT_COLUMNS = ['member', 'row_number', 'organization_id', 'field', 'message']
+
+# NDJSON bodies up to this size are upserted during the request, larger ones are digested by a job
+BULK_SYNC_MAX_BYTES = 1024 * 1024
+
+# Beginning of the upload kept in memory to validate its header and a sample of rows
+SAMPLE_MAX_BYTES = 1024 * 1024
+SAMPLE_ROWS = 100
+
+
+class NDJSONParser(BaseParser):
+    """
+    Hand the body stream over as is, so NDJSON bodies are read line by line instead of loaded at once.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
 
 
 class OrganizationPagination(CursorPagination):
     page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
     ordering = 'id'
 
 
+class DigestJobPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = '-id'
+
+
+class OrganizationStatsPagination(LimitOffsetPagination):
+    default_limit = 1000
+    max_limit = 10000
+
+
 class OrganizationViewSet(viewsets.ModelViewSet):
     queryset = Organization.objects.all()
     serializer_class = OrganizationSerializer
-    parser_classes = (MultiPartParser, FormParser)
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
     pagination_class = OrganizationPagination
+    filter_backends = (OrganizationFilterBackend,)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None and self.request.method == HTTPMethod.GET:
+            context['expand'] = organization_query(self.request).get('expand', set())
+        return context
 
     @action(
         detail=False,
@@ -35,56 +100,297 @@ class OrganizationViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             file = serializer.validated_data['file']
 
-            validation_error = self.validate_csv_file(file)
+            file_path, validation_error = self.save_csv_file(file)
             if validation_error:
                 return Response({'error': validation_error}, status=status.HTTP_400_BAD_REQUEST)
 
-            file_path = self.save_file(file)
-            rows_per_task = serializer.validated_data.get('rows_per_task', 10000)
-            process_organizations_csv.delay(file_path, rows_per_task)
+            job = DigestJob.objects.create(
+                file_path=file_path,
+                rows_per_task=serializer.validated_data.get('rows_per_task'),
+                loader=serializer.validated_data.get('loader', 'bulk'),
+                parser=serializer.validated_data.get('parser', 'python'),
+                duplicate_policy=serializer.validated_data.get('duplicate_policy', 'last'),
+                mode=serializer.validated_data.get('mode', 'upsert'),
+            )
+            process_organizations_csv.apply_async((job.id,), link_error=fail_digest_job.si(job.id))
             return Response(
-                {'status': 'Aww yeah, file is valid and being processed!'},
+                {
+                    'status': 'Aww yeah, file is valid and being processed!',
+                    'job_id': job.id,
+                    'job_url': reverse('digestjob-detail', args=[job.id], request=request),
+                },
                 status=status.HTTP_202_ACCEPTED
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=[HTTPMethod.POST], parser_classes=(NDJSONParser,))
+    def bulk(self, request):
+        """
+        Create or update organizations from an NDJSON body (`application/x-ndjson`), one JSON object per line with
+        the fields of an organization, country and industry by name.
+
+        Bodies up to `BULK_SYNC_MAX_BYTES` are validated and upserted in batches during the request, which returns
+        the digest report. Larger bodies, and bodies of unknown length (no valid `Content-Length`), are streamed
+        to a file and digested by a job, like an uploaded CSV file.
+        """
+        stream = request.data
+        if not hasattr(stream, 'read'):
+            return Response({'error': 'The request body is empty.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH'))
+        except (TypeError, ValueError):
+            content_length = None
+        if content_length is None or not 0 <= content_length <= BULK_SYNC_MAX_BYTES:
+            file_path = self.unique_file_path('bulk.ndjson')
+            with open(file_path, 'wb') as destination:
+                shutil.copyfileobj(stream, destination)
+            job = DigestJob.objects.create(file_path=file_path)
+            process_organizations_csv.apply_async((job.id,), link_error=fail_digest_job.si(job.id))
+            return Response(
+                {
+                    'status': 'The organizations are being processed.',
+                    'job_id': job.id,
+                    'job_url': reverse('digestjob-detail', args=[job.id], request=request),
+                },
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        digest_report = OrganizationDigestReport()
+        lines = iter(stream.readline, b'')
+        first_row = 1
+        while batch := list(itertools.islice(lines, DIGEST_BATCH_ROWS)):
+            merge_reports(digest_report, digest_validated_rows(*validate_ndjson_lines(batch), first_row))
+            first_row += len(batch)
+        count_digest_rows(digest_report)
+        return Response(asdict(digest_report))
+
+    @action(detail=False, methods=[HTTPMethod.GET])
+    def export(self, request):
+        """
+        Stream every organization, or the ones matching the list filters, as CSV (`file_format=csv`, the default)
+        or NDJSON (`file_format=ndjson`).
+        CSV rows have the columns of a digested CSV file and NDJSON lines the fields `bulk` takes,
+        so either export can be digested again.
+        """
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"Unknown file format, use one of: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        content_type, export_lines = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(export_lines(queryset), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="organizations.{file_format}"'
+        return response
+
+    @action(detail=False, methods=[HTTPMethod.GET])
+    def search(self, request):
+        """
+        Organizations matching the keywords of `q`, best ranked first, see `search_organizations`.
+        The list filters narrow the search down.
+        """
+        search = OrganizationSearchSerializer(data=request.query_params)
+        if not search.is_valid():
+            return Response(search.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        organizations = search_organizations(
+            self.filter_queryset(self.get_queryset()), search.validated_data['q'], search.validated_data['limit']
+        )
+        results = [
+            {**self.get_serializer(organization).data, 'rank': organization.rank} for organization in organizations
+        ]
+        return Response({'results': results})
+
     @staticmethod
-    def validate_csv_file(file):
+    def validate_csv_prefix(text, complete):
         """
-        Immediate validation of the uploaded file.
+        Validate the header and a sample of the first rows of the uploaded file.
+        `text` is the decoded beginning of the file, if the file continues its last record may be cut.
         """
         required_headers = {'Organization Id', 'Name', 'Country', 'Industry'}
-        try:
-            if not file.name.lower().endswith('.csv'):
-                return "The uploaded file must be a CSV file."
+        reader = csv.reader(io.StringIO(text, newline=''))
+        header = next(reader, None)
+        if header is None:
+            return "The uploaded file is empty."
+
+        headers = set(header)
+        if not required_headers.issubset(headers):
+            return f"Missing required headers: {required_headers - headers}"
+
+        rows = list(itertools.islice(reader, SAMPLE_ROWS + 1))
+        if not complete:
+            rows = rows[:-1]
+        for row_number, row in enumerate(rows[:SAMPLE_ROWS], start=1):
+            if row and len(row) != len(header):
+                return f"Row {row_number} has {len(row)} fields, {len(header)} expected."
+        return
+
+    @staticmethod
+    def sample_csv(chunks, decompressor=None, check_encoding=True):
+        """
+        Decode the beginning of a CSV file (header plus a sample of rows) from its chunks of bytes.
+        Return the decoded text and whether it is the whole file.
+
+        Chunks are always consumed to the end, with `check_encoding` they are all decoded to reject invalid
+        UTF-8. Compressed chunks are only inflated as far as the sample needs.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        prefix = []
+        prefix_size = 0
+        for chunk in chunks:
+            if decompressor:
+                if prefix_size >= SAMPLE_MAX_BYTES:
+                    continue
+                chunk = decompressor.decompress(chunk, SAMPLE_MAX_BYTES - prefix_size)
+            elif not check_encoding and prefix_size >= SAMPLE_MAX_BYTES:
+                continue
+            text = decoder.decode(chunk)
+            if prefix_size < SAMPLE_MAX_BYTES:
+                prefix.append(text)
+                prefix_size += len(chunk)
+
+        complete = prefix_size < SAMPLE_MAX_BYTES
+        if complete or check_encoding:
+            prefix.append(decoder.decode(b'', final=True))
+        return ''.join(prefix), complete
 
-            file.seek(0)
-            reader = csv.DictReader(file.read().decode('utf-8').splitlines())
-            headers = set(reader.fieldnames)
+    @classmethod
+    def validate_zip_file(cls, file_path):
+        """
+        ZIP archives keep their index at the end, so their CSV members are sampled once the archive is saved.
+        """
+        with zipfile.ZipFile(file_path) as archive:
+            members = csv_members(archive)
+            if not members:
+                return "The ZIP archive does not contain any CSV file."
+            for member in members:
+                with archive.open(member) as stream:
+                    text, complete = cls.sample_csv([stream.read(SAMPLE_MAX_BYTES)], check_encoding=False)
+                validation_error = cls.validate_csv_prefix(text, complete)
+                if validation_error:
+                    return f"{member}: {validation_error}"
+
+    @classmethod
+    def save_csv_file(cls, file):
+        """
+        Save and validate the uploaded file in a single streaming pass.
+
+        Every chunk is written to disk as soon as it arrives and goes through an incremental UTF-8 decoder
+        (gzipped files are inflated on the fly), only the beginning of the file (header plus a sample of rows)
+        is kept in memory for validation. The saved file is removed if it is not valid.
+        """
+        if not file.name.lower().endswith(('.csv', '.csv.gz', '.zip')):
+            return None, "The uploaded file must be a CSV file, a gzipped CSV file or a ZIP archive of CSV files."
+
+        file_path = cls.unique_file_path(file.name)
+        validation_error = None
+        try:
+            with open(file_path, 'wb+') as destination:
+                chunks = cls.write_chunks(file, destination)
+                if is_zip_file(file_path):
+                    collections.deque(chunks, maxlen=0)
+                elif is_gzip_file(file_path):
+                    sample = cls.sample_csv(chunks, zlib.decompressobj(16 + zlib.MAX_WBITS), check_encoding=False)
+                else:
+                    sample = cls.sample_csv(chunks)
 
-            if not required_headers.issubset(headers):
-                return f"Missing required headers: {required_headers - headers}"
-            return
+            if is_zip_file(file_path):
+                validation_error = cls.validate_zip_file(file_path)
+            else:
+                validation_error = cls.validate_csv_prefix(*sample)
         except Exception as e:
-            return str(e)
+            validation_error = str(e)
+
+        if validation_error:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return None, validation_error
+        return file_path, None
+
+    @staticmethod
+    def write_chunks(file, destination):
+        for chunk in file.chunks():
+            destination.write(chunk)
+            yield chunk
 
     @staticmethod
-    def save_file(file):
+    def unique_file_path(file_name):
         """
         We would be using something like S3 normally, but for the sake of this test we will save the file
         in the "local" filesystem that is shared between the Django app and the Celery worker.
         """
-        file_dir = '/mnt/data/'
+        file_dir = settings.DIGEST_DATA_DIR
         os.makedirs(file_dir, exist_ok=True)
 
         # Create a unique file name
         unique_id = uuid.uuid4()
-        unique_file_name = f"{unique_id}_{file.name}"
-        file_path = os.path.join(file_dir, unique_file_name)
+        unique_file_name = f"{unique_id}_{file_name}"
+        return os.path.join(file_dir, unique_file_name)
+
+
+class DigestJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Progress and results of the file digestion jobs.
+    """
+    queryset = DigestJob.objects.all()
+    serializer_class = DigestJobSerializer
+    pagination_class = DigestJobPagination
+
+    @action(detail=True, methods=[HTTPMethod.POST])
+    def resume(self, request, pk=None):
+        """
+        Process the unfinished chunks of a failed or stalled job again, done chunks are kept.
+        """
+        job = self.get_object()
+        if job.state == DigestJob.State.SUCCEEDED:
+            return Response({'error': 'The job already succeeded.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not os.path.exists(job.file_path):
+            return Response({'error': 'The file of the job is no longer available.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        process_organizations_csv.apply_async((job.id,), link_error=fail_digest_job.si(job.id))
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=[HTTPMethod.GET])
+    def errors(self, request, pk=None):
+        """
+        Download the row errors of a job as CSV, in file order (by member for ZIP archives, whose row numbers
+        count from each member). The rows are streamed from the database, so the report can be any size.
+        """
+        job = self.get_object()
+        error_records = job.error_records.order_by('member', 'row_number', 'id').values_list(*ERROR_REPORT_COLUMNS)
+        writer = csv.writer(Echo())
+        lines = itertools.chain(
+            [ERROR_REPORT_COLUMNS], error_records.iterator(chunk_size=ERROR_REPORT_CHUNK_SIZE)
+        )
+        response = StreamingHttpResponse((writer.writerow(line) for line in lines), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="digest-job-{job.id}-errors.csv"'
+        return response
+
+
+class OrganizationStatsViewSet(viewsets.GenericViewSet):
+    """
+    Number of organizations and total employees by country, industry and founding decade.
+    Read from a rollup refreshed when digest jobs finish, see `stats.refresh_organization_stats`.
+    """
+    queryset = OrganizationStats.objects.all()
+    serializer_class = OrganizationStatsSerializer
+    pagination_class = OrganizationStatsPagination
+
+    def list(self, request):
+        query = OrganizationStatsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(organization_stats(**query.validated_data))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
-        # Save the file
-        with open(file_path, 'wb+') as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
 
-        return file_path
+def metrics(request):
+    """
+    Metrics of this web process in the Prometheus text format, Celery workers serve theirs on `DIGEST_METRICS_PORT`.
+    """
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
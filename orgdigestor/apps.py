@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OrgdigestorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orgdigestor'
+
+    def ready(self):
+        # Connect the dimension cache invalidation signals
+        from orgdigestor import dimensions  # noqa: F401
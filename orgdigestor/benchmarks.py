@@ -0,0 +1,187 @@
+# benchmarks.py
+import csv
+import random
+import resource
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from celery.signals import task_postrun, task_prerun
+from django.utils import timezone
+
+from orgdigestor.metrics import count_queries
+from orgdigestor.models import DigestJob
+
+BENCHMARK_HEADER = [
+    'Index', 'Organization Id', 'Name', 'Website', 'Country', 'Description', 'Founded', 'Industry',
+    'Number of employees',
+]
+# Roughly the number of countries in the world and of industries in common taxonomies
+BENCHMARK_COUNTRIES = 250
+BENCHMARK_INDUSTRIES = 150
+MALFORMED_VALUES = {
+    'Website': ['not a url', 'http://', 'www .example.com'],
+    'Founded': ['19x9', '2001-13-01', 'unknown'],
+    'Number of employees': ['n/a', '12 people', '1e3'],
+    'Name': ['', '   '],
+}
+
+
+def organization_id(index):
+    """
+    Spread the row index over 60 bits, distinct indexes always give distinct 15 hex digit ids.
+    """
+    return f'{(index * 0x9E3779B97F4A7C15) & (2 ** 60 - 1):015X}'
+
+
+def zipf_weights(size):
+    # A few countries and industries hold most organizations, like in real data
+    return [1 / (rank + 1) for rank in range(size)]
+
+
+def write_synthetic_csv(file_path, rows, seed=0, duplicate_ratio=0.02, malformed_ratio=0.01, year_only_ratio=0.3):
+    """
+    Write a CSV file with `rows` synthetic organizations, the same `seed` always gives the same file.
+
+    A share of the rows repeats the id of an earlier row, has an invalid value or a wrong number of fields,
+    and `Founded` is only a year on a share of them.
+    """
+    rng = random.Random(seed)
+    countries = [f'Country {index:03}' for index in range(BENCHMARK_COUNTRIES)]
+    industries = [f'Industry {index:03}' for index in range(BENCHMARK_INDUSTRIES)]
+    country_weights = zipf_weights(len(countries))
+    industry_weights = zipf_weights(len(industries))
+
+    with open(file_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(BENCHMARK_HEADER)
+        for index in range(rows):
+            if index and rng.random() < duplicate_ratio:
+                org_id = organization_id(rng.randrange(index))
+            else:
+                org_id = organization_id(index)
+            founded = rng.randrange(1900, 2024)
+            if rng.random() < year_only_ratio:
+                founded = str(founded)
+            else:
+                founded = f'{founded}-{rng.randrange(1, 13):02}-{rng.randrange(1, 29):02}'
+            row = {
+                'Index': index + 1,
+                'Organization Id': org_id,
+                'Name': f'Organization {index}',
+                'Website': f'https://www.org{index}.example.com/',
+                'Country': rng.choices(countries, country_weights)[0],
+                'Description': f'Synthetic organization number {index}, generated for benchmarks.',
+                'Founded': founded,
+                'Industry': rng.choices(industries, industry_weights)[0],
+                'Number of employees': rng.randrange(1, 10000),
+            }
+
+            if rng.random() < malformed_ratio:
+                column = rng.choice([*MALFORMED_VALUES, None])
+                if column is None:
+                    writer.writerow([row[name] for name in BENCHMARK_HEADER][:-2])
+                    continue
+                row[column] = rng.choice(MALFORMED_VALUES[column])
+            writer.writerow([row[name] for name in BENCHMARK_HEADER])
+
+
+@dataclass
+class DigestBenchmark:
+    file_path: str
+    loader: str
+    parser: str
+    rows_per_task: int
+    rows: int = 0
+    seconds: float = 0
+    queries: int = 0
+    peak_rss_mb: float = 0
+    chunk_seconds: list[float] = field(default_factory=list)
+
+    def summary(self):
+        chunk_seconds = sorted(self.chunk_seconds)
+        return {
+            'file_path': self.file_path,
+            'loader': self.loader,
+            'parser': self.parser,
+            'rows_per_task': self.rows_per_task,
+            'rows': self.rows,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows / self.seconds, 1) if self.seconds else None,
+            'queries': self.queries,
+            'queries_per_row': round(self.queries / self.rows, 4) if self.rows else None,
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+            'chunks': len(chunk_seconds),
+            'chunk_p50_seconds': round(percentile(chunk_seconds, 50), 4) if chunk_seconds else None,
+            'chunk_p99_seconds': round(percentile(chunk_seconds, 99), 4) if chunk_seconds else None,
+        }
+
+
+def percentile(sorted_values, percent):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method='inclusive')[percent - 1]
+
+
+@contextmanager
+def time_chunk_tasks(task_names=('orgdigestor.tasks.process_csv_chunk',)):
+    """
+    Collect the duration of every chunk task run by this process.
+    """
+    started, durations = {}, []
+
+    def prerun(task_id=None, task=None, **kwargs):
+        if task.name in task_names:
+            started[task_id] = time.perf_counter()
+
+    def postrun(task_id=None, task=None, **kwargs):
+        if task_id in started:
+            durations.append(time.perf_counter() - started.pop(task_id))
+
+    task_prerun.connect(prerun, weak=False)
+    task_postrun.connect(postrun, weak=False)
+    try:
+        yield durations
+    finally:
+        task_prerun.disconnect(prerun)
+        task_postrun.disconnect(postrun)
+
+
+def run_digest_benchmark(file_path, loader='bulk', parser='python', rows_per_task=10000):
+    """
+    Digest a file end to end in this process and measure it. Like `digest_organizations` does, chunks are
+    processed one after the other, without queueing each other (so each chunk task is timed on its own),
+    and the job is finished once they are done.
+    """
+    from orgdigestor.tasks import finish_digest_job, process_csv_chunk, start_digest_job
+
+    benchmark = DigestBenchmark(file_path, loader, parser, rows_per_task)
+    job = DigestJob.objects.create(file_path=file_path, loader=loader, parser=parser, rows_per_task=rows_per_task)
+    with count_queries() as counter, time_chunk_tasks() as chunk_seconds:
+        started = time.perf_counter()
+        for chunk_id in start_digest_job(job.id):
+            process_csv_chunk.apply((chunk_id,), {'scheduled': False}, throw=True)
+        finish_digest_job(job.id)
+        benchmark.seconds = time.perf_counter() - started
+
+    job.refresh_from_db()
+    benchmark.rows = job.processed_rows
+    benchmark.queries = counter['queries']
+    benchmark.chunk_seconds = chunk_seconds
+    # ru_maxrss is in kilobytes on Linux
+    benchmark.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return benchmark
+
+
+def benchmark_environment():
+    """
+    What a result depends on besides the code: the commit it was measured at and when.
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'measured_at': timezone.now().isoformat()}
@@ -1,5 +1,7 @@
 import os
 from celery import Celery
+from celery.signals import worker_ready
+from celery.worker.control import control_command
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
@@ -11,3 +13,49 @@ app.autodiscover_tasks()
 @app.task(bind=True, ignore_result=True)
 def test_task(self):
     print(f'Request: {self.request!r}')
+
+
+@worker_ready.connect
+def warm_dimension_caches(**kwargs):
+    """
+    Load Country and Industry ids once per worker, before any chunk needs them.
+    """
+    from orgdigestor.dimensions import warm_dimension_caches
+    warm_dimension_caches()
+
+
+@worker_ready.connect
+def start_metrics_exporter(**kwargs):
+    """
+    Serve the metrics of this worker on `DIGEST_METRICS_PORT`, each worker process is scraped on its own.
+    """
+    from django.conf import settings
+    from orgdigestor.metrics import start_metrics_server
+    if settings.DIGEST_METRICS_PORT:
+        start_metrics_server(settings.DIGEST_METRICS_PORT)
+
+
+@control_command(
+    args=[('dimension', str), ('pk', int)],
+    signature='<dimension> [pk]',
+)
+def invalidate_dimension_cache(state, dimension, pk=None):
+    """
+    Forget a Country/Industry row (or the whole dimension) from this worker's cache.
+    """
+    from orgdigestor.dimensions import DIMENSION_CACHES
+    DIMENSION_CACHES[dimension].invalidate(None if pk is None else [pk])
+    return {'ok': f'{dimension} cache invalidated'}
+
+
+@control_command(
+    args=[('chunk_id', int)],
+    signature='[chunk_id]',
+)
+def profile_digest_chunk(state, chunk_id=None):
+    """
+    Sample the call stacks of the given chunk, or of the next chunk this worker processes, into a flamegraph file.
+    """
+    from orgdigestor.metrics import request_chunk_profile
+    request_chunk_profile(chunk_id)
+    return {'ok': f'chunk {chunk_id or "(next)"} will be profiled'}
@@ -0,0 +1,267 @@
+# chunking.py
+import csv
+import gzip
+import io
+import itertools
+import os
+import shutil
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Bytes of a row that are not UTF-8 become lone surrogates, which the row validator rejects, so the row is an error
+# instead of failing its whole chunk
+CSV_DECODE_ERRORS = 'surrogateescape'
+
+
+@dataclass
+class CsvChunk:
+    path: str
+    start_offset: int
+    end_offset: int | None
+    header: list[str]
+    member: str | None = None
+    rows: int | None = None
+    # Number of the first row of the chunk in its file, counting from 1 after the header
+    first_row: int = 1
+
+
+def is_zip_file(file_path):
+    return file_path.lower().endswith('.zip')
+
+
+def is_gzip_file(file_path):
+    return file_path.lower().endswith('.gz')
+
+
+def is_ndjson_file(file_path):
+    return file_path.lower().endswith('.ndjson')
+
+
+def csv_members(archive):
+    """
+    CSV files inside a ZIP archive, leaving out directories and macOS metadata.
+    """
+    return [
+        info.filename for info in archive.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith('.csv')
+        and not info.filename.startswith('__MACOSX/')
+    ]
+
+
+@contextmanager
+def open_csv_source(file_path, member=None):
+    """
+    Open a CSV file as a binary stream, decompressing ZIP members and gzipped files on the fly.
+    """
+    if is_zip_file(file_path):
+        with zipfile.ZipFile(file_path) as archive, archive.open(member) as stream:
+            yield stream
+    elif is_gzip_file(file_path):
+        with gzip.open(file_path, mode='rb') as stream:
+            yield stream
+    else:
+        with open(file_path, mode='rb') as stream:
+            yield stream
+
+
+def csv_sources(file_path):
+    """
+    (path, member) of every CSV file to digest from an upload.
+    """
+    if is_zip_file(file_path):
+        with zipfile.ZipFile(file_path) as archive:
+            return [(file_path, member) for member in csv_members(archive)]
+    return [(file_path, None)]
+
+
+def iter_records(stream):
+    """
+    Yield the raw bytes of each CSV record of a stream, which may span several lines.
+    Lines are only checked for quotes: a quoted field may contain line breaks, so a record only
+    ends on a line break outside quotes.
+    """
+    parts = []
+    in_quotes = False
+    for line in stream:
+        if line.count(b'"') % 2:
+            in_quotes = not in_quotes
+        if in_quotes:
+            parts.append(line)
+        elif parts:
+            parts.append(line)
+            yield b''.join(parts)
+            parts = []
+        else:
+            yield line
+    if parts:
+        yield b''.join(parts)
+
+
+def is_blank_record(record):
+    """
+    Empty lines are not rows, both CSV parsers skip them.
+    """
+    return not record.strip(b'\r\n')
+
+
+def parse_header(record):
+    return next(csv.reader(io.StringIO(record.decode('utf-8-sig'), newline='')), [])
+
+
+def plan_csv_chunks(file_path, rows_per_chunk, member=None):
+    """
+    Scan a CSV file once and cut it into byte ranges of at most `rows_per_chunk` records, blank lines left aside.
+    Nothing is parsed or written, see `iter_records`. `member` is the ZIP member the file was staged from, if any.
+    """
+    with open(file_path, mode='rb') as file:
+        records = iter_records(file)
+        header_record = next(records, b'')
+        return cut_chunks(
+            file_path, records, len(header_record), parse_header(header_record), rows_per_chunk,
+            skip_blank=True, member=member,
+        )
+
+
+def plan_ndjson_chunks(file_path, rows_per_chunk):
+    """
+    Cut an NDJSON file (one JSON object per line, no header) into byte ranges of at most `rows_per_chunk` lines.
+    Blank lines count, `validate_ndjson_lines` numbers rows by line.
+    """
+    with open(file_path, mode='rb') as file:
+        return cut_chunks(file_path, file, 0, [], rows_per_chunk)
+
+
+def cut_chunks(file_path, records, start_offset, header, rows_per_chunk, skip_blank=False, member=None):
+    """
+    Byte ranges of at most `rows_per_chunk` of the raw `records` of a file, which start at `start_offset`.
+    With `skip_blank`, blank records belong to a range but are not counted as rows, see `is_blank_record`.
+    """
+    chunks = []
+    offset = start_offset
+    rows = 0
+    first_row = 1
+    for record in records:
+        offset += len(record)
+        if skip_blank and is_blank_record(record):
+            continue
+        rows += 1
+        if rows == rows_per_chunk:
+            chunks.append(CsvChunk(file_path, start_offset, offset, header, member, rows, first_row))
+            start_offset = offset
+            first_row += rows
+            rows = 0
+
+    if rows:
+        chunks.append(CsvChunk(file_path, start_offset, offset, header, member, rows, first_row))
+    return chunks
+
+
+def plan_stream_chunk(file_path, member=None):
+    """
+    Compressed data cannot be seeked, a gzipped file or ZIP member is digested as a single stream
+    chunk (`end_offset` is None) that is decompressed on the fly and processed in batches.
+    Its number of rows is unknown until it is processed.
+    """
+    with open_csv_source(file_path, member) as stream:
+        header_record = next(iter_records(stream), b'')
+    return CsvChunk(file_path, len(header_record), None, parse_header(header_record), member)
+
+
+def stage_csv_source(file_path, member, staged_path):
+    """
+    Decompress a gzipped file or a ZIP member to `staged_path`, a plain CSV file that can be cut into byte ranges.
+    """
+    os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+    with open_csv_source(file_path, member) as stream, open(staged_path, mode='wb') as staged:
+        shutil.copyfileobj(stream, staged)
+
+
+def plan_chunks(file_path, rows_per_chunk, staging_prefix=None):
+    """
+    Plan the chunks of an upload: byte ranges for plain CSV and NDJSON files.
+
+    Gzipped files and the CSV members of a ZIP archive cannot be seeked. With `staging_prefix` they are
+    decompressed once to `<staging_prefix>-<index>.csv` and cut like plain CSV files, their chunks keep the member
+    they come from, so a compressed upload is digested in parallel like any other (the staged files take its
+    uncompressed size on disk). Without it each of them is a single stream chunk, see `plan_stream_chunk`.
+    """
+    if is_ndjson_file(file_path):
+        return plan_ndjson_chunks(file_path, rows_per_chunk)
+    if is_zip_file(file_path) or is_gzip_file(file_path):
+        if staging_prefix is None:
+            return [plan_stream_chunk(path, member) for path, member in csv_sources(file_path)]
+        chunks = []
+        for index, (path, member) in enumerate(csv_sources(file_path)):
+            staged_path = f'{staging_prefix}-{index}.csv'
+            stage_csv_source(path, member, staged_path)
+            chunks.extend(plan_csv_chunks(staged_path, rows_per_chunk, member))
+        return chunks
+    return plan_csv_chunks(file_path, rows_per_chunk)
+
+
+def chunk_read_bytes(chunk):
+    """
+    Bytes of a chunk read from disk, the compressed size of stream chunks of gzipped files and ZIP members.
+    """
+    if is_zip_file(chunk['path']):
+        with zipfile.ZipFile(chunk['path']) as archive:
+            return archive.getinfo(chunk['member']).compress_size
+    if chunk['end_offset'] is None:
+        return os.path.getsize(chunk['path'])
+    return chunk['end_offset'] - chunk['start_offset']
+
+
+def uncompressed_size(file_path):
+    """
+    Size of the data of an upload once decompressed. Gzip only records it modulo 4 GiB.
+    """
+    if is_zip_file(file_path):
+        with zipfile.ZipFile(file_path) as archive:
+            return sum(archive.getinfo(member).file_size for member in csv_members(archive))
+    if is_gzip_file(file_path):
+        with open(file_path, mode='rb') as file:
+            file.seek(-4, os.SEEK_END)
+            return int.from_bytes(file.read(4), 'little')
+    return os.path.getsize(file_path)
+
+
+def estimate_rows(file_path, sample_rows=1000):
+    """
+    Estimate the rows of an upload from its uncompressed size and the average size of its first `sample_rows` records,
+    without scanning it.
+    """
+    sources = csv_sources(file_path)
+    if not sources:
+        return 0
+    with open_csv_source(*sources[0]) as stream:
+        records = stream if is_ndjson_file(file_path) else iter_records(stream)
+        sample = [len(record) for record in itertools.islice(records, sample_rows + 1)]
+    if len(sample) <= 1:
+        return 0
+    return round(uncompressed_size(file_path) / (sum(sample) / len(sample)))
+
+
+def read_csv_chunk(chunk):
+    """
+    Yield the records of a chunk planned by `plan_chunks`, as dicts keyed by the file header.
+    """
+    with open_csv_source(chunk['path'], chunk.get('member')) as stream:
+        if chunk['end_offset'] is None:
+            stream.read(chunk['start_offset'])
+            text = io.TextIOWrapper(stream, encoding='utf-8', errors=CSV_DECODE_ERRORS, newline='')
+        else:
+            stream.seek(chunk['start_offset'])
+            data = stream.read(chunk['end_offset'] - chunk['start_offset'])
+            text = io.StringIO(data.decode('utf-8', CSV_DECODE_ERRORS), newline='')
+        yield from csv.DictReader(text, fieldnames=chunk['header'])
+
+
+def read_ndjson_chunk(chunk):
+    """
+    Yield the lines of an NDJSON chunk planned by `plan_ndjson_chunks`.
+    """
+    with open(chunk['path'], mode='rb') as file:
+        file.seek(chunk['start_offset'])
+        yield from io.BytesIO(file.read(chunk['end_offset'] - chunk['start_offset']))
@@ -0,0 +1,308 @@
+# columnar.py
+import csv
+import io
+import sys
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models
+import pyarrow
+import pyarrow.compute as pc
+from pyarrow import csv as pyarrow_csv
+
+from orgdigestor.chunking import CSV_DECODE_ERRORS, is_blank_record, iter_records, open_csv_source
+from orgdigestor.ingestion import (
+    CSV_COLUMNS, CSV_NULL_FIELDS, DIGEST_BATCH_ROWS, csv_value, drop_positions, restore_positions, row_validator,
+    storable_text,
+)
+from orgdigestor.models import Organization
+from orgdigestor.validators import url_validator
+
+# Every character `str.strip()` removes, so trimmed columns match the Python path exactly
+WHITESPACE = ''.join(chr(code) for code in range(sys.maxunicode + 1) if chr(code).isspace())
+DATE_PATTERN = r'^[0-9]{4}(-[0-9]{2}-[0-9]{2})?$'
+INTEGER_PATTERN = r'^-?[0-9]{1,10}(\.0*)?$'
+
+
+class ColumnRule:
+    """
+    Whole-column counterpart of a `validators` rule: `values` are the coerced values and `fast_valid`
+    marks the rows whose value is valid for sure. Anything else (invalid or unusual values) goes through
+    the row validator, which gives the exact values and error messages of the Python path.
+    """
+    allow_null = False
+
+    def __call__(self, column):
+        raise NotImplementedError
+
+
+class CharColumnRule(ColumnRule):
+
+    def __init__(self, max_length=None, allow_blank=False, allow_null=False, url=False):
+        self.max_length = max_length
+        self.allow_blank = allow_blank
+        self.allow_null = allow_null
+        self.url = url
+
+    def __call__(self, column):
+        values = pc.utf8_trim(column, characters=WHITESPACE)
+        lengths = pc.utf8_length(values)
+        fast_valid = pc.invert(pc.match_substring(values, '\x00'))
+        if self.max_length is not None:
+            fast_valid = pc.and_(fast_valid, pc.less_equal(lengths, self.max_length))
+        if not self.allow_blank:
+            fast_valid = pc.and_(fast_valid, pc.greater(lengths, 0))
+        if self.url:
+            # URLs are checked once per distinct value
+            urls = pc.unique(pc.filter(values, pc.greater(lengths, 0))).to_pylist()
+            valid_urls = pyarrow.array([''] + [url for url in urls if is_valid_url(url)], pyarrow.string())
+            fast_valid = pc.and_(fast_valid, pc.is_in(values, value_set=valid_urls))
+        return values, fast_valid
+
+
+class DateColumnRule(ColumnRule):
+
+    def __init__(self, allow_null=False):
+        self.allow_null = allow_null
+
+    def __call__(self, column):
+        # Year-only values are taken as January 1st, like `OrganizationSerializer` does
+        iso_dates = pc.if_else(
+            pc.equal(pc.utf8_length(column), 4), pc.binary_join_element_wise(column, '-01-01', ''), column
+        )
+        fast_valid = pc.and_(
+            pc.match_substring_regex(column, DATE_PATTERN),
+            pc.invert(pc.starts_with(column, '0000')),
+        )
+        dates = pc.strptime(pc.if_else(fast_valid, iso_dates, None), format='%Y-%m-%d', unit='s', error_is_null=True)
+        # strptime rolls days over (February 30th), only dates that format back to themselves are valid
+        fast_valid = pc.fill_null(pc.equal(pc.strftime(dates, format='%Y-%m-%d'), iso_dates), False)
+        return pc.cast(dates, pyarrow.date32()), fast_valid
+
+
+class IntegerColumnRule(ColumnRule):
+
+    def __init__(self, min_value=None, max_value=None, allow_null=False):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.allow_null = allow_null
+
+    def __call__(self, column):
+        fast_valid = pc.match_substring_regex(column, INTEGER_PATTERN)
+        digits = pc.replace_substring_regex(pc.if_else(fast_valid, column, None), r'\.0*$', '')
+        values = pc.cast(digits, pyarrow.int64())
+        if self.max_value is not None:
+            fast_valid = pc.and_(fast_valid, pc.less_equal(values, self.max_value))
+        if self.min_value is not None:
+            fast_valid = pc.and_(fast_valid, pc.greater_equal(values, self.min_value))
+        return values, pc.fill_null(fast_valid, False)
+
+
+def is_valid_url(value):
+    try:
+        url_validator(value)
+    except DjangoValidationError:
+        return False
+    return True
+
+
+def compile_column_rule(model_field):
+    """
+    Build the column rule of a model field, mirroring `validators.compile_rule`.
+    """
+    if isinstance(model_field, models.ForeignKey):
+        name_field = model_field.related_model._meta.get_field('name')
+        return CharColumnRule(name_field.max_length)
+    if isinstance(model_field, models.DateField):
+        return DateColumnRule(allow_null=model_field.null)
+    if isinstance(model_field, models.IntegerField):
+        return IntegerColumnRule(
+            min_value=next((v.limit_value for v in model_field.validators if isinstance(v, MinValueValidator)), None),
+            max_value=next((v.limit_value for v in model_field.validators if isinstance(v, MaxValueValidator)), None),
+            allow_null=model_field.null,
+        )
+    if isinstance(model_field, (models.CharField, models.TextField)):
+        return CharColumnRule(
+            model_field.max_length,
+            allow_blank=model_field.blank and not model_field.primary_key,
+            allow_null=model_field.null,
+            url=isinstance(model_field, models.URLField),
+        )
+    raise TypeError(f'No column rule for {model_field!r}')
+
+
+COLUMN_RULES = {
+    column: compile_column_rule(Organization._meta.get_field(field_name))
+    for column, field_name in CSV_COLUMNS.items()
+}
+
+
+class InvalidRows:
+    """
+    `invalid_row_handler` of the Arrow reader: rows with a wrong number of fields are only noted,
+    the batch is then parsed by the Python path, which tolerates them.
+    """
+
+    def __init__(self):
+        self.found = False
+
+    def __call__(self, row):
+        self.found = True
+        return 'skip'
+
+
+def read_table(data, header, include_columns=tuple(CSV_COLUMNS)):
+    """
+    Parse the raw bytes of a batch of records into a table of string columns, the `include_columns` in the header.
+    Return None when the batch needs the Python path: repeated header names or malformed rows.
+    """
+    if len(set(header)) != len(header):
+        return None
+    columns = [column for column in include_columns if column in header]
+    invalid_rows = InvalidRows()
+    table = pyarrow_csv.read_csv(
+        io.BytesIO(data),
+        read_options=pyarrow_csv.ReadOptions(column_names=header),
+        parse_options=pyarrow_csv.ParseOptions(newlines_in_values=True, invalid_row_handler=invalid_rows),
+        convert_options=pyarrow_csv.ConvertOptions(
+            column_types={column: pyarrow.string() for column in columns},
+            include_columns=columns,
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    if invalid_rows.found:
+        return None
+    return table
+
+
+def validate_table(table):
+    """
+    Coerce and validate the columns of a table at once.
+    Return the valid rows, in file order, and the (position, organization id, errors) of the invalid ones.
+    """
+    values = {}
+    fast_valid = pyarrow.array([True] * table.num_rows, pyarrow.bool_())
+    for column, field_name in CSV_COLUMNS.items():
+        rule = COLUMN_RULES[column]
+        if column not in table.column_names:
+            # Missing columns are None in the Python path
+            values[field_name] = None
+            if not rule.allow_null:
+                fast_valid = pyarrow.array([False] * table.num_rows, pyarrow.bool_())
+            continue
+        raw_values = table.column(column)
+        if field_name in CSV_NULL_FIELDS:
+            # Empty cells are null, see `csv_value`
+            raw_values = pc.if_else(pc.equal(raw_values, ''), None, raw_values)
+            table = table.set_column(table.column_names.index(column), column, raw_values)
+        values[field_name], column_valid = rule(raw_values)
+        if rule.allow_null:
+            column_valid = pc.or_kleene(column_valid, pc.is_null(raw_values))
+        fast_valid = pc.and_(fast_valid, column_valid)
+
+    valid_positions = pc.indices_nonzero(fast_valid)
+    valid_columns = {
+        field_name: column.take(valid_positions).to_pylist() if column is not None else [None] * len(valid_positions)
+        for field_name, column in values.items()
+    }
+    rows = {
+        position: dict(zip(valid_columns, row_values))
+        for position, row_values in zip(valid_positions.to_pylist(), zip(*valid_columns.values()))
+    }
+
+    # The rest is validated row by row to report the same values and messages as the Python path
+    invalid_rows = []
+    slow_positions = pc.indices_nonzero(pc.invert(fast_valid))
+    slow_table = table.take(slow_positions)
+    slow_columns = {column: slow_table.column(column).to_pylist() for column in slow_table.column_names}
+    for index, position in enumerate(slow_positions.to_pylist()):
+        data = {field_name: None for field_name in CSV_COLUMNS.values()}
+        data.update({CSV_COLUMNS[column]: raw_values[index] for column, raw_values in slow_columns.items()})
+        row_values, errors = row_validator.validate(data)
+        if errors:
+            invalid_rows.append((position, row_values.get('id'), errors))
+        else:
+            rows[position] = row_values
+
+    return [rows[position] for position in sorted(rows)], invalid_rows
+
+
+def read_python_rows(data, header):
+    rows = csv.DictReader(io.StringIO(data.decode('utf-8', CSV_DECODE_ERRORS), newline=''), fieldnames=header)
+    return [
+        {field_name: csv_value(field_name, row.get(column)) for column, field_name in CSV_COLUMNS.items()}
+        for row in rows
+    ]
+
+
+def iter_chunk_batches(chunk, batch_rows=DIGEST_BATCH_ROWS):
+    """
+    Yield the raw bytes of the records of a chunk planned by `plan_chunks`, at most `batch_rows` records at a time.
+    """
+    with open_csv_source(chunk['path'], chunk.get('member')) as stream:
+        if chunk['end_offset'] is None:
+            stream.read(chunk['start_offset'])
+        else:
+            stream.seek(chunk['start_offset'])
+            data = stream.read(chunk['end_offset'] - chunk['start_offset'])
+            if chunk.get('rows') is not None and chunk['rows'] <= batch_rows:
+                yield data
+                return
+            stream = io.BytesIO(data)
+
+        batch, rows = [], 0
+        for record in iter_records(stream):
+            batch.append(record)
+            if is_blank_record(record):
+                continue
+            rows += 1
+            if rows == batch_rows:
+                yield b''.join(batch)
+                batch, rows = [], 0
+        if batch:
+            yield b''.join(batch)
+
+
+def parse_batch(data, header, skip_positions=frozenset()):
+    """
+    Parse and validate a batch of raw records, with column operations whenever the batch allows it.
+    Records at `skip_positions` are parsed but neither validated nor returned.
+    Return the valid rows, the (position, organization id, errors) of the invalid ones, and the number of records.
+    """
+    try:
+        table = read_table(data, header)
+    except pyarrow.ArrowInvalid:
+        table = None
+    if table is not None:
+        num_rows = table.num_rows
+        kept_positions = range(num_rows)
+        if skip_positions:
+            kept = pyarrow.array([position not in skip_positions for position in range(num_rows)], pyarrow.bool_())
+            kept_positions = pc.indices_nonzero(kept).to_pylist()
+            table = table.filter(kept)
+        valid_rows, invalid_rows = validate_table(table)
+        return valid_rows, restore_positions(invalid_rows, kept_positions), num_rows
+
+    rows = read_python_rows(data, header)
+    kept_rows, kept_positions = drop_positions(rows, skip_positions)
+    valid_rows, invalid_rows = row_validator.validate_many(kept_rows)
+    return valid_rows, restore_positions(invalid_rows, kept_positions), len(rows)
+
+
+def read_batch_ids(data, header):
+    """
+    Trimmed organization ids of a batch of raw records, in the order `parse_batch` reads them, as an Arrow array.
+    Ids are null when the column is missing.
+    """
+    id_column = next(column for column, field_name in CSV_COLUMNS.items() if field_name == 'id')
+    try:
+        table = read_table(data, header, include_columns=[id_column])
+    except pyarrow.ArrowInvalid:
+        table = None
+    if table is None:
+        # Ids of rows that are not UTF-8 hold lone surrogates, which Arrow strings cannot
+        ids = [storable_text(row['id']) for row in read_python_rows(data, header)]
+        return pc.utf8_trim(pyarrow.array(ids, pyarrow.string()), characters=WHITESPACE)
+    if id_column not in table.column_names:
+        return pyarrow.nulls(table.num_rows, pyarrow.string())
+    return pc.utf8_trim(table.column(id_column).combine_chunks(), characters=WHITESPACE)
@@ -0,0 +1,69 @@
+# copy_loader.py
+import uuid
+from django.db import connection, transaction
+
+from orgdigestor.ingestion import (
+    ORGANIZATION_FIELDS, OrganizationDigestReport, build_organizations, organization_arrays, report_invalid_rows,
+    unnest_sql, write_organizations,
+)
+from orgdigestor.metrics import DIGEST_STAGE_SECONDS
+
+
+def load_csv_with_copy(batches, first_row=1, on_row_errors=None):
+    """
+    Load the rows of a whole chunk into an unlogged staging table and merge it into the organizations table with
+    a single set-based upsert, the "copy" loader. `batches` are the parsed batches of the chunk, see
+    `tasks.parse_chunk_batches`, so rows are read and validated exactly like the bulk loader does: a malformed
+    record is a row error, it never fails the chunk.
+
+    Rows are staged with `INSERT ... SELECT FROM unnest(...)` rather than Postgres COPY, which psycopg2 cannot
+    run on the cooperative connections of the gevent workers.
+    Created vs updated comes straight from the upsert, the earlier occurrences of repeated ids count as duplicates
+    and the ids the upsert skipped because their content did not change are unchanged.
+
+    Row errors are handed to `on_row_errors` a batch at a time when given, instead of being kept in the report,
+    so any number of them fits in memory.
+    """
+    digest_report = OrganizationDigestReport()
+    staging_table = f'orgdigestor_staging_{uuid.uuid4().hex}'
+    columns = ', '.join(model_field.column for model_field in ORGANIZATION_FIELDS)
+    column_definitions = ', '.join(
+        f'{model_field.column} {model_field.db_type(connection)}' for model_field in ORGANIZATION_FIELDS
+    )
+    staged = 0
+
+    # The staging table only lives in this transaction, a failed load rolls it back with everything else
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE UNLOGGED TABLE {staging_table} (row_number bigserial, {column_definitions})')
+        for valid_rows, invalid_rows, rows in batches:
+            batch_report = report_invalid_rows(invalid_rows, OrganizationDigestReport(), first_row)
+            digest_report.errors += batch_report.errors
+            if on_row_errors is None:
+                digest_report.row_errors.extend(batch_report.row_errors)
+            elif batch_report.row_errors:
+                on_row_errors(batch_report.row_errors)
+            first_row += rows
+
+            organizations = build_organizations(valid_rows)
+            if organizations:
+                with DIGEST_STAGE_SECONDS.time(stage='copy'):
+                    # Rows are numbered in file order, the last one of a repeated id wins the merge
+                    cursor.execute(
+                        f'INSERT INTO {staging_table} ({columns}) SELECT * FROM {unnest_sql()}',
+                        organization_arrays(organizations),
+                    )
+                staged += len(organizations)
+
+        if staged:
+            cursor.execute(f'SELECT count(DISTINCT id) FROM {staging_table}')
+            (distinct,) = cursor.fetchone()
+            created, updated = write_organizations(
+                f'(SELECT DISTINCT ON (id) * FROM {staging_table} ORDER BY id, row_number DESC) AS organizations'
+            )
+            digest_report.created = created
+            digest_report.updated = updated
+            digest_report.unchanged = distinct - created - updated
+            digest_report.duplicates = staged - distinct
+        cursor.execute(f'DROP TABLE {staging_table}')
+
+    return digest_report
@@ -0,0 +1,172 @@
+# dimensions.py
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.text import slugify
+
+from orgdigestor.models import Country, Industry
+
+logger = logging.getLogger(__name__)
+
+
+class DimensionCache:
+    """
+    Bounded LRU map of dimension keys (country name, industry slug) to their ids.
+
+    There is one instance per dimension and per process, shared by every task of the worker.
+    Critical sections never do I/O, so the lock is never held across a greenlet switch.
+    """
+
+    def __init__(self, model, key_field, max_size):
+        self.model = model
+        self.key_field = key_field
+        self.max_size = max_size
+        self.warmed = False
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get_many(self, keys):
+        """
+        Return the cached ids for the given keys and the set of keys that missed.
+        """
+        found, missing = {}, set()
+        with self._lock:
+            for key in keys:
+                if key in self._ids:
+                    self._ids.move_to_end(key)
+                    found[key] = self._ids[key]
+                else:
+                    missing.add(key)
+        return found, missing
+
+    def set_many(self, key_ids):
+        with self._lock:
+            for key, pk in key_ids.items():
+                self._ids[key] = pk
+                self._ids.move_to_end(key)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def invalidate(self, pks=None):
+        """
+        Forget the entries pointing to the given ids, or everything if no ids are given.
+        """
+        with self._lock:
+            if pks is None:
+                self._ids.clear()
+                self.warmed = False
+                return
+            pks = set(pks)
+            for key in [key for key, pk in self._ids.items() if pk in pks]:
+                del self._ids[key]
+
+    def warm(self):
+        """
+        Load up to `max_size` rows with a single query.
+        """
+        rows = self.model.objects.order_by('id').values_list(self.key_field, 'id')[:self.max_size]
+        self.set_many(dict(rows))
+        self.warmed = True
+
+    def resolve(self, keys, create_missing):
+        """
+        Map keys to ids, hitting the database only for the keys missing from the cache.
+        `create_missing` receives the missing keys and returns their ids, creating rows as needed.
+        New ids are only cached once committed, a rolled back transaction leaves nothing behind.
+        """
+        if not self.warmed:
+            self.warm()
+        key_ids, missing = self.get_many(keys)
+        if missing:
+            created = create_missing(missing)
+            transaction.on_commit(lambda: self.set_many(created))
+            key_ids.update(created)
+        return key_ids
+
+
+country_cache = DimensionCache(Country, 'name', getattr(settings, 'DIGEST_DIMENSION_CACHE_SIZE', 10000))
+industry_cache = DimensionCache(Industry, 'slug', getattr(settings, 'DIGEST_DIMENSION_CACHE_SIZE', 10000))
+DIMENSION_CACHES = {
+    'country': country_cache,
+    'industry': industry_cache,
+}
+
+
+def insert_or_fetch_countries(names):
+    """
+    Race-safe creation: concurrent inserts of the same name are ignored and the winner is read back.
+    """
+    Country.objects.bulk_create([Country(name=name) for name in names], ignore_conflicts=True)
+    return dict(Country.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def insert_or_fetch_industries(slug_names):
+    Industry.objects.bulk_create(
+        [Industry(name=name, slug=slug) for slug, name in slug_names.items()],
+        ignore_conflicts=True
+    )
+    return dict(Industry.objects.filter(slug__in=slug_names).values_list('slug', 'id'))
+
+
+def resolve_countries(names):
+    """
+    Map country names to their ids, creating the missing ones.
+    """
+    return country_cache.resolve(set(names), insert_or_fetch_countries)
+
+
+def resolve_industries(names):
+    """
+    Map industry names to their ids through their slug, creating the missing ones.
+    The first name seen for a new slug becomes the industry name.
+    """
+    slugs = {name: slugify(name) for name in names}
+    slug_names = {}
+    for name, slug in slugs.items():
+        slug_names.setdefault(slug, name)
+
+    slug_ids = industry_cache.resolve(
+        slug_names.keys(),
+        lambda missing: insert_or_fetch_industries({slug: slug_names[slug] for slug in missing})
+    )
+    return {name: slug_ids[slug] for name, slug in slugs.items()}
+
+
+def warm_dimension_caches():
+    for cache in DIMENSION_CACHES.values():
+        cache.warm()
+
+
+def invalidate_dimension_caches():
+    for cache in DIMENSION_CACHES.values():
+        cache.invalidate()
+
+
+def broadcast_invalidation(dimension, pk):
+    """
+    Tell every worker to forget a dimension row, once the change is committed.
+    """
+    from orgdigestor.celery import app
+
+    def broadcast():
+        try:
+            app.control.broadcast('invalidate_dimension_cache', arguments={'dimension': dimension, 'pk': pk})
+        except Exception:
+            logger.exception('Could not broadcast the %s cache invalidation', dimension)
+
+    transaction.on_commit(broadcast)
+
+
+@receiver([post_save, post_delete], sender=Country)
+@receiver([post_save, post_delete], sender=Industry)
+def invalidate_dimension(sender, instance, **kwargs):
+    dimension = 'country' if sender is Country else 'industry'
+    DIMENSION_CACHES[dimension].invalidate([instance.pk])
+    broadcast_invalidation(dimension, instance.pk)
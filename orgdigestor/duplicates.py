@@ -0,0 +1,97 @@
+# duplicates.py
+import itertools
+import json
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+import pyarrow
+import pyarrow.compute as pc
+from rest_framework.exceptions import ErrorDetail
+
+from orgdigestor.chunking import is_ndjson_file, read_ndjson_chunk
+from orgdigestor.columnar import iter_chunk_batches, read_batch_ids
+from orgdigestor.ingestion import OrganizationDigestReport, RowError, storable_text
+
+REPEATED_ID = ErrorDetail('This organization id appears more than once in the file.', code='unique')
+
+
+def ndjson_line_id(line):
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get('id') is None:
+        return None
+    return str(data['id']).strip()
+
+
+def read_chunk_ids(chunk):
+    """
+    Organization ids of the rows of a chunk planned by `plan_chunks`, in the order its rows are digested,
+    as an Arrow array. Rows without an id (invalid anyway) have a null one.
+    """
+    if is_ndjson_file(chunk['path']):
+        return pyarrow.array([ndjson_line_id(line) for line in read_ndjson_chunk(chunk)], pyarrow.string())
+    batches = [read_batch_ids(data, chunk['header']) for data in iter_chunk_batches(chunk)]
+    return pyarrow.chunked_array(batches, pyarrow.string()).combine_chunks()
+
+
+def find_duplicate_rows(chunk_ids, policy):
+    """
+    Find the ids repeated in the rows of the chunks of a job (the `read_chunk_ids` of each chunk), across chunk
+    boundaries, and return the [position, organization id] of the rows each chunk leaves out, in position order:
+    every occurrence of a repeated id but the last one ("last" policy) or the first one ("first"),
+    or all of them ("reject").
+
+    Ids are indexed in a single Arrow array (a few bytes per row, no Python object per id) and counted at once,
+    only the occurrences of repeated ids are turned into Python objects.
+    """
+    ids = pyarrow.chunked_array(chunk_ids, pyarrow.string()).combine_chunks()
+    duplicate_rows = [[] for _ in chunk_ids]
+
+    counts = pc.value_counts(ids)
+    repeated = pc.filter(
+        counts.field('values'),
+        pc.and_(pc.greater(counts.field('counts'), 1), pc.not_equal(counts.field('values'), '')),
+    )
+    if not len(repeated):
+        return duplicate_rows
+
+    occurrences = {}
+    indices = pc.indices_nonzero(pc.is_in(ids, value_set=repeated))
+    for index, organization_id in zip(indices.to_pylist(), ids.take(indices).to_pylist()):
+        occurrences.setdefault(organization_id, []).append(index)
+    left_out = []
+    for organization_id, indexes in occurrences.items():
+        if policy == 'last':
+            indexes = indexes[:-1]
+        elif policy == 'first':
+            indexes = indexes[1:]
+        left_out.extend((index, organization_id) for index in indexes)
+
+    # Index in the job -> chunk and position in the chunk. Ids are stored with the chunks, see `storable_text`
+    offsets = list(itertools.accumulate((len(ids) for ids in chunk_ids), initial=0))
+    for index, organization_id in sorted(left_out):
+        chunk_index = bisect_right(offsets, index) - 1
+        duplicate_rows[chunk_index].append([index - offsets[chunk_index], storable_text(organization_id)])
+    return duplicate_rows
+
+
+def rows_between(duplicate_rows, start, stop):
+    """
+    The duplicate rows of a chunk at positions from `start` to `stop` (excluded).
+    """
+    return duplicate_rows[
+        bisect_left(duplicate_rows, start, key=itemgetter(0)):bisect_left(duplicate_rows, stop, key=itemgetter(0))
+    ]
+
+
+def report_duplicate_rows(duplicate_rows, policy, first_row):
+    """
+    Account the rows left out as duplicates, as errors with the "reject" policy.
+    """
+    if policy != 'reject':
+        return OrganizationDigestReport(duplicates=len(duplicate_rows))
+    return OrganizationDigestReport(errors=len(duplicate_rows), row_errors=[
+        RowError(first_row + position, organization_id, 'id', str(REPEATED_ID))
+        for position, organization_id in duplicate_rows
+    ])
@@ -0,0 +1,55 @@
+# exports.py
+import csv
+import datetime
+import json
+
+from orgdigestor.ingestion import CSV_COLUMNS
+
+# CSV header -> lookup of the exported value, the same headers `map_org_row` reads so exports can be digested again.
+# Null values are exported as empty cells, which are digested as null, see `csv_value`
+EXPORT_COLUMNS = {
+    column: f'{field_name}__name' if field_name in ('country', 'industry') else field_name
+    for column, field_name in CSV_COLUMNS.items()
+}
+# Organizations read from the database at a time when streaming an export
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """
+    File-like object whose `write` hands the line back, so `csv.writer` can feed a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the exported values of the organizations, in `EXPORT_COLUMNS` order, through a server-side cursor.
+    Countries and industries are joined in the same query, only `chunk_size` rows are in memory at a time.
+    """
+    rows = queryset.order_by('id').values_list(*EXPORT_COLUMNS.values()).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield tuple(value.isoformat() if isinstance(value, datetime.date) else value for value in row)
+
+
+def export_csv_lines(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in export_rows(queryset):
+        yield writer.writerow(row)
+
+
+def export_ndjson_lines(queryset):
+    """
+    One JSON object per organization, with the fields `/bulk/` takes so the export can be posted again.
+    """
+    for row in export_rows(queryset):
+        yield json.dumps(dict(zip(CSV_COLUMNS.values(), row))) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', export_csv_lines),
+    'ndjson': ('application/x-ndjson', export_ndjson_lines),
+}
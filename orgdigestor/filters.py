@@ -0,0 +1,51 @@
+# filters.py
+from rest_framework.filters import BaseFilterBackend
+
+from orgdigestor.serializers import OrganizationQuerySerializer
+
+# Query parameter -> lookup of the organization filters, each one is backed by an index of `Organization`
+ORGANIZATION_FILTERS = {
+    'country': 'country__name',
+    'industry': 'industry__name',
+    'founded_after': 'founded__gte',
+    'founded_before': 'founded__lte',
+    'min_employees': 'number_of_employees__gte',
+    'max_employees': 'number_of_employees__lte',
+}
+
+
+def organization_query(request):
+    """
+    Validated query parameters of an organization list, invalid ones are a 400 response.
+    """
+    serializer = OrganizationQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+class OrganizationFilterBackend(BaseFilterBackend):
+    """
+    Filter organizations by country, industry, founded range and number of employees range,
+    and join the relations in `expand` so embedding their names does not take a query per row.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = organization_query(request)
+        queryset = queryset.filter(**{
+            lookup: query[parameter] for parameter, lookup in ORGANIZATION_FILTERS.items() if parameter in query
+        })
+        if query.get('expand'):
+            queryset = queryset.select_related(*sorted(query['expand']))
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': name,
+                'required': False,
+                'in': 'query',
+                'description': str(field.help_text),
+                'schema': {'type': 'integer' if name.endswith('_employees') else 'string'},
+            }
+            for name, field in OrganizationQuerySerializer().fields.items()
+        ]
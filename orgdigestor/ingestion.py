@@ -0,0 +1,270 @@
+# ingestion.py
+import json
+from dataclasses import dataclass, field
+from django.db import IntegrityError, connection, transaction
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.settings import api_settings
+
+from orgdigestor.dimensions import invalidate_dimension_caches, resolve_countries, resolve_industries
+from orgdigestor.metrics import DIGEST_STAGE_SECONDS
+from orgdigestor.models import Organization
+from orgdigestor.validators import SURROGATE_CHARACTERS, OrganizationRowValidator
+
+
+# CSV header -> Organization field, see `map_org_row`
+CSV_COLUMNS = {
+    'Organization Id': 'id',
+    'Name': 'name',
+    'Country': 'country',
+    'Industry': 'industry',
+    'Website': 'website',
+    'Description': 'description',
+    'Founded': 'founded',
+    'Number of employees': 'number_of_employees',
+}
+ORGANIZATION_UPDATE_FIELDS = (
+    'name', 'country', 'industry', 'website', 'description', 'founded', 'number_of_employees', 'content_hash'
+)
+BULK_BATCH_SIZE = 1000
+# Whether each row was inserted or updated comes from the write itself (rows inserted have no xmax), so concurrent
+# chunks never count an organization twice as created. Rows whose content hash did not change are not written.
+UPSERT_SQL = """
+WITH upserted AS (
+    INSERT INTO {organization_table} AS organization (id, {columns})
+    SELECT id, {columns} FROM {source}
+    ORDER BY id
+    ON CONFLICT (id) DO UPDATE SET {updates}
+    WHERE organization.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+# Rows validated and written at once when a chunk is streamed
+DIGEST_BATCH_ROWS = 10000
+ORGANIZATION_FIELDS = [Organization._meta.get_field(name) for name in ('id', *ORGANIZATION_UPDATE_FIELDS)]
+
+
+row_validator = OrganizationRowValidator()
+
+INVALID_JSON_OBJECT = ErrorDetail('Expected a JSON object.', code='invalid')
+# Values of the optional fields left out of a JSON object, like `OrganizationSerializer` does
+OPTIONAL_FIELD_DEFAULTS = {
+    field_name: None if model_field.null else ''
+    for field_name in CSV_COLUMNS.values()
+    if (model_field := Organization._meta.get_field(field_name)).null or model_field.blank
+}
+# Fields an empty CSV cell leaves null, CSV has no null of its own (exports write null values as empty cells)
+CSV_NULL_FIELDS = frozenset(field_name for field_name, default in OPTIONAL_FIELD_DEFAULTS.items() if default is None)
+
+
+def csv_value(field_name, value):
+    return None if value == '' and field_name in CSV_NULL_FIELDS else value
+
+
+@dataclass
+class RowError:
+    """
+    An error of a row of the digested file, `row_number` counts rows from 1 after the header.
+    Errors that are not about a field (e.g. a failed batch) have an empty `field`.
+    """
+    row_number: int | None
+    organization_id: str | None
+    field: str
+    message: str
+
+    def __str__(self):
+        where = f'Row {self.row_number}' if self.row_number is not None else 'Rows'
+        if self.organization_id:
+            where += f' ({self.organization_id})'
+        if self.field:
+            where += f' {self.field}'
+        return f'{where}: {self.message}'
+
+
+@dataclass
+class OrganizationDigestReport:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    errors: int = 0
+    # Organizations missing from a snapshot, see `snapshot.delete_missing_organizations`
+    deleted: int = 0
+    row_errors: list[RowError] = field(default_factory=list)
+
+
+def storable_text(value):
+    """
+    Postgres text cannot hold NUL characters nor lone surrogates (e.g. in the id of an invalid row, see
+    `chunking.CSV_DECODE_ERRORS`), they are stored as U+FFFD.
+    """
+    return SURROGATE_CHARACTERS.sub('\ufffd', value.replace('\x00', '\ufffd')) if isinstance(value, str) else value
+
+
+def merge_reports(digest_report, other):
+    digest_report.created += other.created
+    digest_report.updated += other.updated
+    digest_report.unchanged += other.unchanged
+    digest_report.duplicates += other.duplicates
+    digest_report.errors += other.errors
+    digest_report.deleted += other.deleted
+    digest_report.row_errors.extend(other.row_errors)
+    return digest_report
+
+
+def report_invalid_rows(invalid_rows, digest_report, first_row=None):
+    """
+    Account the (position, organization id, errors) of invalid rows as errors in the report,
+    with one `RowError` per field error. Positions are numbered from `first_row` when it is known.
+    """
+    for position, organization_id, errors in invalid_rows:
+        digest_report.errors += 1
+        row_number = None if first_row is None else first_row + position
+        for field_name, field_errors in errors.items():
+            digest_report.row_errors.extend(
+                RowError(row_number, organization_id, field_name, str(error)) for error in field_errors
+            )
+    return digest_report
+
+
+def drop_positions(rows, positions):
+    """
+    The rows of a batch but the ones at `positions`, and the position in the batch of each row kept,
+    see `restore_positions`.
+    """
+    kept = [(position, row) for position, row in enumerate(rows) if position not in positions]
+    return [row for _, row in kept], [position for position, _ in kept]
+
+
+def restore_positions(invalid_rows, kept_positions):
+    """
+    Map the (position, organization id, errors) of invalid rows validated without some rows of their batch
+    back to the positions of the whole batch.
+    """
+    return [
+        (kept_positions[position], organization_id, errors) for position, organization_id, errors in invalid_rows
+    ]
+
+
+def validate_ndjson_lines(lines):
+    """
+    Validate NDJSON lines, each one a JSON object with the fields of `OrganizationSerializer` (country and
+    industry by name). Return the valid values and the (position, organization id, errors) of the invalid lines,
+    like `OrganizationRowValidator.validate_many`. Blank lines are skipped.
+    """
+    valid_rows, invalid_rows = [], []
+    for position, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            data = None
+            error = ErrorDetail(f'Invalid JSON: {e}', code='parse_error')
+        else:
+            error = INVALID_JSON_OBJECT
+        if not isinstance(data, dict):
+            invalid_rows.append((position, None, {api_settings.NON_FIELD_ERRORS_KEY: [error]}))
+            continue
+
+        values, errors = row_validator.validate({**OPTIONAL_FIELD_DEFAULTS, **data})
+        if errors:
+            invalid_rows.append((position, values.get('id'), errors))
+        else:
+            valid_rows.append(values)
+    return valid_rows, invalid_rows
+
+
+def build_organizations(valid_rows):
+    """
+    Organizations of validated rows, in row order, with their country and industry resolved and their content hash.
+    """
+    with DIGEST_STAGE_SECONDS.time(stage='dimensions'):
+        country_ids = resolve_countries({data['country'] for data in valid_rows})
+        industry_ids = resolve_industries({data['industry'] for data in valid_rows})
+
+    organizations = []
+    for data in valid_rows:
+        organization = Organization(
+            id=data['id'],
+            name=data['name'],
+            country_id=country_ids[data['country']],
+            industry_id=industry_ids[data['industry']],
+            website=data.get('website', ''),
+            description=data.get('description', ''),
+            founded=data.get('founded'),
+            number_of_employees=data.get('number_of_employees'),
+        )
+        organization.content_hash = organization.compute_content_hash()
+        organizations.append(organization)
+    return organizations
+
+
+def unnest_sql():
+    """
+    Rows with the columns of `ORGANIZATION_FIELDS` out of one array per column, see `organization_arrays`,
+    so any number of rows is a single statement.
+    """
+    arrays = ', '.join(f'%s::{model_field.db_type(connection)}[]' for model_field in ORGANIZATION_FIELDS)
+    columns = ', '.join(model_field.column for model_field in ORGANIZATION_FIELDS)
+    return f'unnest({arrays}) AS organizations ({columns})'
+
+
+def organization_arrays(organizations):
+    return [
+        [model_field.get_db_prep_save(getattr(organization, model_field.attname), connection)
+         for organization in organizations]
+        for model_field in ORGANIZATION_FIELDS
+    ]
+
+
+def write_organizations(source, params=None):
+    """
+    Upsert the rows of `source`, an SQL relation with the columns of `ORGANIZATION_FIELDS` and one row per id,
+    see `UPSERT_SQL`. Return the number of organizations created and updated.
+    """
+    columns = [model_field.column for model_field in ORGANIZATION_FIELDS[1:]]
+    upsert_sql = UPSERT_SQL.format(
+        organization_table=Organization._meta.db_table,
+        columns=', '.join(columns),
+        source=source,
+        updates=', '.join(f'{column} = EXCLUDED.{column}' for column in columns),
+    )
+    with DIGEST_STAGE_SECONDS.time(stage='write'):
+        try:
+            # A single statement writes the rows in id order, so concurrent chunks lock them in the same order
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(upsert_sql, params)
+                return cursor.fetchone()
+        except IntegrityError:
+            # A cached Country/Industry may have been deleted behind the cache's back, start over on retry
+            invalidate_dimension_caches()
+            raise
+
+
+def upsert_organizations(valid_rows, digest_report):
+    """
+    Write validated rows with a single `INSERT ... ON CONFLICT (id) DO UPDATE` per batch.
+
+    Repeated ids inside the rows are collapsed (the last one wins) and the earlier occurrences are accounted
+    as duplicates, each organization is written once. Created vs updated comes from the upsert itself,
+    see `UPSERT_SQL`: rows identical to the stored ones (same content hash) are not written and accounted as unchanged.
+    """
+    organizations = {organization.id: organization for organization in build_organizations(valid_rows)}
+    if not organizations:
+        return digest_report
+
+    created, updated = write_organizations(unnest_sql(), organization_arrays(organizations.values()))
+    digest_report.created += created
+    digest_report.updated += updated
+    digest_report.unchanged += len(organizations) - created - updated
+    digest_report.duplicates += len(valid_rows) - len(organizations)
+    return digest_report
+
+
+def digest_validated_rows(valid_rows, invalid_rows, first_row=None):
+    """
+    Write rows already validated by a parser, see `columnar.parse_batch`.
+    """
+    digest_report = report_invalid_rows(invalid_rows, OrganizationDigestReport(), first_row)
+    return upsert_organizations(valid_rows, digest_report)
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from orgdigestor.benchmarks import benchmark_environment, run_digest_benchmark, write_synthetic_csv
+from orgdigestor.dimensions import invalidate_dimension_caches
+from orgdigestor.models import Country, Industry, Organization
+
+COMPARED_METRICS = ('rows_per_second', 'queries_per_row', 'peak_rss_mb', 'chunk_p50_seconds', 'chunk_p99_seconds')
+
+
+class Command(BaseCommand):
+    help = (
+        'Digest CSV files end to end against the configured database, with the chunk tasks run one after the other '
+        'in this process, and report rows/s, queries per row, peak RSS and chunk latencies as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument('--file', dest='file_path', help='Digest this file instead of synthetic ones.')
+        source.add_argument(
+            '--rows', type=int, nargs='+', default=[10000],
+            help='Sizes of the synthetic files to digest, for instance 10000 1000000 10000000.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--duplicate-ratio', type=float, default=0.02)
+        parser.add_argument(
+            '--malformed-ratio', type=float, default=0.01,
+            help='Share of synthetic rows with an invalid value or a wrong number of fields.',
+        )
+        parser.add_argument('--loader', choices=('bulk', 'copy'), default='bulk')
+        parser.add_argument('--parser', choices=('python', 'columnar'), default='python')
+        parser.add_argument('--rows-per-task', type=int, default=10000)
+        parser.add_argument(
+            '--truncate', action='store_true',
+            help='Delete every organization, country and industry before each run, so runs start from the same state.',
+        )
+        parser.add_argument('--output', help='Save the results to this JSON file.')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare the results with.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        results = []
+        with tempfile.TemporaryDirectory() as data_dir:
+            if options['file_path']:
+                file_paths = [options['file_path']]
+            else:
+                file_paths = []
+                for rows in options['rows']:
+                    file_path = os.path.join(data_dir, f'organizations_{rows}.csv')
+                    write_synthetic_csv(
+                        file_path, rows, seed=options['seed'],
+                        duplicate_ratio=options['duplicate_ratio'], malformed_ratio=options['malformed_ratio'],
+                    )
+                    file_paths.append(file_path)
+
+            for file_path in file_paths:
+                if options['truncate']:
+                    self.truncate()
+                benchmark = run_digest_benchmark(
+                    file_path, options['loader'], options['parser'], options['rows_per_task']
+                )
+                summary = benchmark.summary()
+                if not options['file_path']:
+                    summary['file_path'] = os.path.basename(file_path)
+                results.append(summary)
+                self.stdout.write(json.dumps(summary))
+
+        report = {
+            **benchmark_environment(),
+            'seed': options['seed'],
+            'duplicate_ratio': options['duplicate_ratio'],
+            'malformed_ratio': options['malformed_ratio'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Results saved to {options['output']}")
+        if baseline is not None:
+            self.compare(baseline, report)
+
+    @staticmethod
+    def truncate():
+        tables = [model._meta.db_table for model in (Organization, Country, Industry)]
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {", ".join(tables)} CASCADE')
+        invalidate_dimension_caches()
+
+    def compare(self, baseline, report):
+        """
+        Print the change of every metric against the baseline run of the same file and settings.
+        """
+        def key(result):
+            return result['file_path'], result['loader'], result['parser'], result['rows_per_task']
+
+        baseline_results = {key(result): result for result in baseline['results']}
+        for result in report['results']:
+            before = baseline_results.get(key(result))
+            if before is None:
+                self.stdout.write(f'{result["file_path"]}: no baseline result')
+                continue
+            changes = []
+            for metric in COMPARED_METRICS:
+                if before.get(metric) and result.get(metric) is not None:
+                    change = (result[metric] - before[metric]) / before[metric] * 100
+                    changes.append(f'{metric} {before[metric]} -> {result[metric]} ({change:+.1f}%)')
+            self.stdout.write(f'{result["file_path"]} vs {baseline.get("commit")}: ' + ', '.join(changes))
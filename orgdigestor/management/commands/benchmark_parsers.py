@@ -0,0 +1,35 @@
+import time
+from dataclasses import asdict
+from django.core.management.base import BaseCommand
+
+from orgdigestor.chunking import plan_chunks
+from orgdigestor.tasks import parse_chunk_batches
+
+
+class Command(BaseCommand):
+    help = 'Compare the chunk parsers on a CSV file, without writing to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', help='CSV file, gzipped CSV file or ZIP archive of CSV files.')
+        parser.add_argument('--rows-per-task', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per parser, the best one is reported.')
+
+    def handle(self, *args, **options):
+        chunks = [asdict(chunk) for chunk in plan_chunks(options['file_path'], options['rows_per_task'])]
+        results = {}
+        for parser in ('python', 'columnar'):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                batches = [batch for chunk in chunks for batch in parse_chunk_batches(chunk, parser)]
+                timings.append(time.perf_counter() - started)
+            rows = sum(batch[2] for batch in batches)
+            results[parser] = [(valid_rows, invalid_rows) for valid_rows, invalid_rows, _ in batches]
+            best = min(timings)
+            self.stdout.write(
+                f'{parser}: {rows} rows in {best:.3f}s ({rows / best:,.0f} rows/s), '
+                f'{sum(len(batch[0]) for batch in batches)} valid'
+            )
+
+        if results['python'] != results['columnar']:
+            self.stderr.write('The parsers disagree on the rows or errors of this file.')
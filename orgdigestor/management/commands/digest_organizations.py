@@ -0,0 +1,103 @@
+import concurrent.futures
+import multiprocessing
+import os
+import time
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from orgdigestor.models import DigestJob
+from orgdigestor.snapshot import IncompleteSnapshot
+from orgdigestor.tasks import fail_digest_job, finish_digest_job, process_csv_chunk, start_digest_job
+
+# Seconds between two updates of the progress line
+PROGRESS_INTERVAL = 0.5
+
+
+def process_chunk(chunk_id):
+    """
+    Process a chunk in a pool process like a worker would, retries included.
+    The job is finished by the command once every chunk is done.
+    """
+    process_csv_chunk.apply((chunk_id,), {'scheduled': False}, throw=True)
+
+
+class Command(BaseCommand):
+    help = (
+        'Digest a file of organizations on this machine without a broker: the file is planned into chunks like '
+        '`process_organizations_csv` does and the chunks are processed by a pool of processes, each one with its '
+        'own database connection.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', help='CSV, gzipped CSV, ZIP of CSV files or NDJSON file.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Processes digesting chunks in parallel, the number of CPUs by default.',
+        )
+        parser.add_argument('--loader', choices=('bulk', 'copy'), default='bulk')
+        parser.add_argument('--parser', choices=('python', 'columnar'), default='python')
+        parser.add_argument(
+            '--duplicates', choices=('last', 'first', 'reject'), default='last',
+            help='Which occurrence of an organization id repeated in the file is digested, "reject" digests none.',
+        )
+        parser.add_argument(
+            '--snapshot', action='store_true',
+            help='The file lists every organization, the ones missing from it are deleted once it is digested.',
+        )
+        parser.add_argument(
+            '--rows-per-task', type=int, default=None,
+            help='Rows per chunk, chosen from the size of the file and the throughput of previous jobs by default.',
+        )
+
+    def handle(self, *args, **options):
+        file_path = os.path.abspath(options['file_path'])
+        if not os.path.isfile(file_path):
+            raise CommandError(f'{file_path} is not a file.')
+        if options['workers'] < 1:
+            raise CommandError('At least one worker is needed.')
+
+        job = DigestJob.objects.create(
+            file_path=file_path, loader=options['loader'], parser=options['parser'],
+            rows_per_task=options['rows_per_task'], duplicate_policy=options['duplicates'],
+            mode='snapshot' if options['snapshot'] else 'upsert',
+        )
+        chunk_ids = start_digest_job(job.id)
+        workers = min(options['workers'], len(chunk_ids)) or 1
+        self.stdout.write(f'Digest job {job.id}: {len(chunk_ids)} chunks, {workers} processes')
+
+        failures = []
+        started = time.perf_counter()
+        if chunk_ids:
+            # Spawned processes start without the database connection of this one, each opens its own
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            ) as executor:
+                futures = {executor.submit(process_chunk, chunk_id): chunk_id for chunk_id in chunk_ids}
+                pending = set(futures)
+                while pending:
+                    done, pending = concurrent.futures.wait(pending, timeout=PROGRESS_INTERVAL)
+                    failures.extend(
+                        (futures[future], future.exception()) for future in done if future.exception() is not None
+                    )
+                    if done or self.stdout.isatty():
+                        self.write_progress(job.id, len(chunk_ids) - len(pending), len(chunk_ids), started)
+            self.stdout.write('')
+
+        if failures:
+            fail_digest_job(job.id)
+            for chunk_id, exception in failures:
+                self.stderr.write(f'Chunk {chunk_id} failed: {exception}')
+            raise CommandError(f'{len(failures)} chunks of job {job.id} failed, the job can be resumed.')
+        try:
+            finish_digest_job(job.id)
+        except IncompleteSnapshot as e:
+            raise CommandError(str(e))
+
+    def write_progress(self, job_id, done_chunks, total_chunks, started):
+        job = DigestJob.objects.values('processed_rows', 'total_rows').get(pk=job_id)
+        rows = f"{job['processed_rows']}/{job['total_rows']}" if job['total_rows'] else str(job['processed_rows'])
+        rows_per_second = job['processed_rows'] / (time.perf_counter() - started)
+        self.stdout.write(
+            f'\rChunks {done_chunks}/{total_chunks}, rows {rows}, {rows_per_second:.0f} rows/s', ending=''
+        )
+        self.stdout.flush()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from orgdigestor.benchmarks import write_synthetic_csv
+
+
+class Command(BaseCommand):
+    help = 'Write a reproducible CSV file of synthetic organizations, see `write_synthetic_csv`.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path')
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--duplicate-ratio', type=float, default=0.02)
+        parser.add_argument('--malformed-ratio', type=float, default=0.01)
+        parser.add_argument('--year-only-ratio', type=float, default=0.3)
+
+    def handle(self, *args, **options):
+        write_synthetic_csv(
+            options['file_path'],
+            options['rows'],
+            seed=options['seed'],
+            duplicate_ratio=options['duplicate_ratio'],
+            malformed_ratio=options['malformed_ratio'],
+            year_only_ratio=options['year_only_ratio'],
+        )
+        self.stdout.write(f"{options['rows']} organizations written to {options['file_path']}")
@@ -0,0 +1,314 @@
+# metrics.py
+import bisect
+import collections
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.conf import settings
+from django.db import connection
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Every metric of this process, in the order they are exported
+REGISTRY = []
+
+
+class Metric:
+    """
+    A metric of this process, with one value per combination of its labels.
+
+    Values live in memory and are exported in the Prometheus text format, see `render_metrics`.
+    Each process has its own values, the web app and every worker are scraped separately.
+    Critical sections never do I/O, so the lock is never held across a greenlet switch.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def label_values(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes the labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+        Yield the (name, labels, value) of the samples of the metric.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # Per bucket (not cumulative) counts, the last one is +Inf, then the sum
+            values = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0])
+            values[index] += 1
+            values[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def time_each(self, iterable, **labels):
+        """
+        Yield the items of an iterable, observing how long each one took to produce.
+        """
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(time.perf_counter() - started, **labels)
+            yield item
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': str(bound)}, cumulative
+            yield f'{self.name}_count', labels, cumulative
+            yield f'{self.name}_sum', labels, counts[-1]
+
+
+DIGEST_ROWS = Counter(
+    'orgdigestor_digest_rows_total', 'Rows digested, by outcome.', ['outcome'],
+)
+DIGEST_READ_BYTES = Counter(
+    'orgdigestor_digest_read_bytes_total', 'Bytes of digested files read from disk.',
+)
+DIGEST_STAGE_SECONDS = Histogram(
+    'orgdigestor_digest_stage_seconds', 'Time spent in each stage of the digest pipeline.', ['stage'],
+)
+DIGEST_CHUNK_SECONDS = Histogram(
+    'orgdigestor_digest_chunk_seconds', 'Time to process a chunk, from its claim to its last checkpoint.',
+    ['loader'],
+)
+DIGEST_CHUNK_QUEUE_SECONDS = Histogram(
+    'orgdigestor_digest_chunk_queue_seconds', 'Time between queueing a chunk and a worker claiming it.',
+)
+DIGEST_CHUNK_ROWS_PER_SECOND = Histogram(
+    'orgdigestor_digest_chunk_rows_per_second', 'Rows processed per second by a chunk.', ['loader'],
+    buckets=(100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000),
+)
+DIGEST_CHUNK_QUERIES = Histogram(
+    'orgdigestor_digest_chunk_queries', 'Database queries run by a chunk.', ['loader'],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    'orgdigestor_db_pool_connections', 'Open connections of the database pool, idle or in use.', ['alias', 'state'],
+)
+DB_POOL_CONNECTS = Counter(
+    'orgdigestor_db_pool_connects_total', 'Connections opened by the database pool.', ['alias'],
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    'orgdigestor_db_pool_wait_seconds', 'Time waited to check a connection out of the database pool.', ['alias'],
+)
+DB_POOL_TIMEOUTS = Counter(
+    'orgdigestor_db_pool_timeouts_total', 'Checkouts that found no connection of the database pool in time.',
+    ['alias'],
+)
+
+
+def count_digest_rows(digest_report):
+    for outcome in ('created', 'updated', 'unchanged', 'duplicates', 'errors'):
+        DIGEST_ROWS.inc(getattr(digest_report, outcome), outcome=outcome)
+
+
+def escape_label_value(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def render_metrics(registry=REGISTRY):
+    """
+    Every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            if labels:
+                label_pairs = ','.join(f'{label}="{escape_label_value(text)}"' for label, text in labels.items())
+                name = f'{name}{{{label_pairs}}}'
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the queries run on the default connection.
+    """
+    counter = {'queries': 0}
+
+    def execute(execute, sql, params, many, context):
+        counter['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(execute):
+        yield counter
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes would flood the worker log
+        pass
+
+
+def start_metrics_server(port):
+    """
+    Serve the metrics of this process over HTTP on `port`, from a daemon thread (a greenlet under gevent).
+    """
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True).start()
+    return server
+
+
+class SamplingProfiler:
+    """
+    Sample the call stack of the code running it every `interval` seconds of CPU time, with SIGPROF.
+
+    Only the thread (or greenlet) that entered the profiler is sampled, time it spends waiting
+    (e.g. on the database) is not. Signals are only handled by the main thread, so it must be entered there.
+    Stacks are counted in the collapsed format of flamegraph.pl and speedscope, "outer;inner count".
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._greenlet = None
+        self._previous_handler = None
+
+    def __enter__(self):
+        self._greenlet = greenlet.getcurrent() if greenlet is not None else None
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, *exc_info):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler)
+
+    def _sample(self, signum, frame):
+        if self._greenlet is not None and greenlet.getcurrent() is not self._greenlet:
+            return
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})')
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+# Chunks to profile in this process, None stands for the next chunk, see `profile_chunk`
+_profile_requests = set()
+_profile_lock = threading.Lock()
+
+
+def request_chunk_profile(chunk_id=None):
+    with _profile_lock:
+        _profile_requests.add(chunk_id)
+
+
+@contextmanager
+def profile_chunk(chunk_id):
+    """
+    Sample the processing of a chunk if it was requested, see `request_chunk_profile`.
+    Samples are written to `DIGEST_PROFILE_DIR` as `chunk-<id>.folded` once the chunk is processed.
+    """
+    with _profile_lock:
+        requested = next((key for key in (chunk_id, None) if key in _profile_requests), False)
+        if requested is not False:
+            _profile_requests.discard(requested)
+    if requested is False:
+        yield
+        return
+
+    try:
+        profiler = SamplingProfiler(settings.DIGEST_PROFILE_INTERVAL).__enter__()
+    except ValueError:
+        logger.warning('Chunk %s cannot be profiled outside the main thread', chunk_id)
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.__exit__()
+        os.makedirs(settings.DIGEST_PROFILE_DIR, exist_ok=True)
+        file_path = os.path.join(settings.DIGEST_PROFILE_DIR, f'chunk-{chunk_id}.folded')
+        with open(file_path, mode='w') as file:
+            file.write(profiler.collapsed())
+        logger.info('Profile of chunk %s written to %s', chunk_id, file_path)
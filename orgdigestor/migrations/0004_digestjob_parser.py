@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0003_digestjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestjob',
+            name='parser',
+            field=models.CharField(default='python', max_length=10),
+        ),
+    ]
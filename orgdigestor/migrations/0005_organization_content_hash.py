@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:36
+
+from django.db import migrations, models
+
+# Same fingerprint as `Organization.compute_content_hash`, so the first re-import can already skip rows
+BACKFILL_CONTENT_HASH_SQL = """
+UPDATE orgdigestor_organization SET content_hash = md5(
+    length(name) || ':' || name
+    || length(country_id::text) || ':' || country_id::text
+    || length(industry_id::text) || ':' || industry_id::text
+    || length(website) || ':' || website
+    || length(description) || ':' || description
+    || length(coalesce(to_char(founded, 'YYYY-MM-DD'), '')) || ':' || coalesce(to_char(founded, 'YYYY-MM-DD'), '')
+    || length(coalesce(number_of_employees::text, '')) || ':' || coalesce(number_of_employees::text, '')
+)::uuid
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0004_digestjob_parser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestjob',
+            name='unchanged',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='content_hash',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_CONTENT_HASH_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0005_organization_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('path', models.CharField(max_length=255)),
+                ('member', models.CharField(max_length=255, null=True)),
+                ('start_offset', models.PositiveBigIntegerField()),
+                ('end_offset', models.PositiveBigIntegerField(null=True)),
+                ('header', models.JSONField(default=list)),
+                ('rows', models.PositiveIntegerField(null=True)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('processed_rows', models.PositiveBigIntegerField(default=0)),
+                ('created', models.PositiveBigIntegerField(default=0)),
+                ('updated', models.PositiveBigIntegerField(default=0)),
+                ('unchanged', models.PositiveBigIntegerField(default=0)),
+                ('errors', models.PositiveBigIntegerField(default=0)),
+                ('queued_at', models.DateTimeField(null=True)),
+                ('heartbeat_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='orgdigestor.digestjob')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'heartbeat_at'], name='digest_chunk_state_heartbeat')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='digestchunk',
+            constraint=models.UniqueConstraint(fields=('job', 'index'), name='unique_digest_chunk_index'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0006_digestchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='error_records', to='orgdigestor.digestjob')),
+            ],
+        ),
+    ]
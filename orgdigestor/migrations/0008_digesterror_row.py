@@ -0,0 +1,42 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0007_digesterror'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestchunk',
+            name='first_row',
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='digesterror',
+            name='field',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='digesterror',
+            name='organization_id',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='digesterror',
+            name='row_number',
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='digestjob',
+            name='stored_errors',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='digesterror',
+            index=models.Index(fields=['job', 'row_number'], name='digest_error_job_row'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:48
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking writes to the organizations table
+    atomic = False
+
+    dependencies = [
+        ('orgdigestor', '0008_digesterror_row'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='organization',
+            index=models.Index(fields=['country', 'industry', 'id'], name='organization_country_industry'),
+        ),
+        AddIndexConcurrently(
+            model_name='organization',
+            index=models.Index(fields=['founded'], name='organization_founded'),
+        ),
+        AddIndexConcurrently(
+            model_name='organization',
+            index=models.Index(fields=['number_of_employees'], name='organization_employees'),
+        ),
+        # The country index is redundant once the composite one exists
+        migrations.AlterField(
+            model_name='organization',
+            name='country',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='orgdigestor.country'),
+        ),
+    ]
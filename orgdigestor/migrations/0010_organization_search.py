@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:50
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0009_organization_filter_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        # Adding a stored generated column rewrites the organizations table, its indexes come in 0015
+        migrations.AddField(
+            model_name='organization',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector('description', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+ADDED_ROWS = """
+    SELECT country_id, industry_id, orgdigestor_organization_decade(founded) AS decade,
+        1 AS organizations, coalesce(number_of_employees, 0) AS employees
+    FROM new_rows
+"""
+REMOVED_ROWS = """
+    SELECT country_id, industry_id, orgdigestor_organization_decade(founded) AS decade,
+        -1 AS organizations, -coalesce(number_of_employees, 0) AS employees
+    FROM old_rows
+"""
+# Event -> (transition tables, rows it adds and removes)
+TRIGGER_EVENTS = {
+    'insert': ('NEW TABLE AS new_rows', ADDED_ROWS),
+    'update': ('OLD TABLE AS old_rows NEW TABLE AS new_rows', f'{ADDED_ROWS} UNION ALL {REMOVED_ROWS}'),
+    'delete': ('OLD TABLE AS old_rows', REMOVED_ROWS),
+}
+
+# Statement level triggers log the net change of every write to the organizations table (bulk upserts, COPY merges,
+# the API) as a few aggregated rows, see `stats.refresh_organization_stats`
+STATS_TRIGGERS_SQL = """
+CREATE FUNCTION orgdigestor_organization_decade(founded date) RETURNS smallint AS $$
+    SELECT (extract(year FROM founded)::int / 10 * 10)::smallint
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE FUNCTION orgdigestor_truncate_organization_stats() RETURNS trigger AS $$
+BEGIN
+    TRUNCATE orgdigestor_organizationstats, orgdigestor_organizationstatsdelta;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER orgdigestor_organization_stats_truncate AFTER TRUNCATE ON orgdigestor_organization
+FOR EACH STATEMENT EXECUTE FUNCTION orgdigestor_truncate_organization_stats();
+""" + ''.join(f"""
+CREATE FUNCTION orgdigestor_log_organization_stats_{event}() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO orgdigestor_organizationstatsdelta (country_id, industry_id, decade, organizations, employees)
+    SELECT country_id, industry_id, decade, sum(organizations), sum(employees)
+    FROM ({changes}) changes
+    GROUP BY country_id, industry_id, decade
+    HAVING sum(organizations) <> 0 OR sum(employees) <> 0;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER orgdigestor_organization_stats_{event} AFTER {event.upper()} ON orgdigestor_organization
+REFERENCING {transition_tables} FOR EACH STATEMENT EXECUTE FUNCTION orgdigestor_log_organization_stats_{event}();
+""" for event, (transition_tables, changes) in TRIGGER_EVENTS.items())
+
+DROP_STATS_TRIGGERS_SQL = """
+DROP TRIGGER orgdigestor_organization_stats_truncate ON orgdigestor_organization;
+DROP FUNCTION orgdigestor_truncate_organization_stats();
+""" + ''.join(f"""
+DROP TRIGGER orgdigestor_organization_stats_{event} ON orgdigestor_organization;
+DROP FUNCTION orgdigestor_log_organization_stats_{event}();
+""" for event in TRIGGER_EVENTS) + """
+DROP FUNCTION orgdigestor_organization_decade(date);
+"""
+
+BACKFILL_STATS_SQL = """
+INSERT INTO orgdigestor_organizationstats (country_id, industry_id, decade, organizations, employees)
+SELECT country_id, industry_id, orgdigestor_organization_decade(founded), count(*), coalesce(sum(number_of_employees), 0)
+FROM orgdigestor_organization
+GROUP BY 1, 2, 3
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0010_organization_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('decade', models.SmallIntegerField(null=True)),
+                ('organizations', models.BigIntegerField(default=0)),
+                ('employees', models.BigIntegerField(default=0)),
+                ('country', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='orgdigestor.country')),
+                ('industry', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='orgdigestor.industry')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrganizationStatsDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('decade', models.SmallIntegerField(null=True)),
+                ('organizations', models.BigIntegerField()),
+                ('employees', models.BigIntegerField()),
+                ('country', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='orgdigestor.country')),
+                ('industry', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='orgdigestor.industry')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='organizationstats',
+            constraint=models.UniqueConstraint(fields=('country', 'industry', 'decade'), name='unique_organization_stats', nulls_distinct=False),
+        ),
+        # The rollup starts from the current table, later changes come through the triggers
+        migrations.RunSQL(STATS_TRIGGERS_SQL, DROP_STATS_TRIGGERS_SQL),
+        migrations.RunSQL(BACKFILL_STATS_SQL, migrations.RunSQL.noop),
+    ]
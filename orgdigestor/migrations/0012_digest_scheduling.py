@@ -0,0 +1,38 @@
+# Generated by Django 5.0.7 on 2026-10-17 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0011_organization_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestchunk',
+            name='started_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='digestjob',
+            name='baseline_row_seconds',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='digestjob',
+            name='inflight_limit',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='digestjob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='digestjob',
+            name='rows_per_task',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
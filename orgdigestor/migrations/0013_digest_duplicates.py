@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0012_digest_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestchunk',
+            name='duplicate_rows',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='digestchunk',
+            name='duplicates',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='digestjob',
+            name='duplicate_policy',
+            field=models.CharField(default='last', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='digestjob',
+            name='duplicates',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0013_digest_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestjob',
+            name='deleted',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='digestjob',
+            name='mode',
+            field=models.CharField(default='upsert', max_length=10),
+        ),
+    ]
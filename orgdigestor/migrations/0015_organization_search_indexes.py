@@ -0,0 +1,25 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:10
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking writes to the organizations table
+    atomic = False
+
+    dependencies = [
+        ('orgdigestor', '0014_digest_snapshot'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='organization',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='organization_search_vector'),
+        ),
+        AddIndexConcurrently(
+            model_name='organization',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='organization_name_trigram', opclasses=['gin_trgm_ops']),
+        ),
+    ]
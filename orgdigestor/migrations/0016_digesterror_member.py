@@ -0,0 +1,26 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgdigestor', '0015_organization_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='digesterror',
+            name='digest_error_job_row',
+        ),
+        migrations.AddField(
+            model_name='digesterror',
+            name='member',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='digesterror',
+            index=models.Index(fields=['job', 'member', 'row_number'], name='digest_error_job_member_row'),
+        ),
+    ]
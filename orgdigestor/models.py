@@ -1,5 +1,12 @@
+import hashlib
+import uuid
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 
+# Text search configuration of `Organization.search_vector`, search queries must use the same one
+SEARCH_CONFIG = 'english'
+
 
 class Country(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -20,7 +27,8 @@ class Organization(models.Model):
 
     id = models.CharField(primary_key=True, max_length=15, editable=False)
     name = models.CharField(max_length=100)
-    country = models.ForeignKey(Country, on_delete=models.CASCADE)
+    # Covered by the `organization_country_industry` index
+    country = models.ForeignKey(Country, on_delete=models.CASCADE, db_index=False)
     industry = models.ForeignKey(Industry, on_delete=models.CASCADE)
 
     website = models.URLField(blank=True)
@@ -28,5 +36,209 @@ class Organization(models.Model):
     founded = models.DateField(null=True)
     number_of_employees = models.IntegerField(null=True)
 
+    # Kept up to date by Postgres on every write, whatever the loader
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    # Fingerprint of the fields below, re-imports skip the rows whose fingerprint did not change
+    content_hash = models.UUIDField(null=True, editable=False)
+    CONTENT_HASH_FIELDS = (
+        'name', 'country_id', 'industry_id', 'website', 'description', 'founded', 'number_of_employees'
+    )
+
+    class Meta:
+        # Back the filters of `filters.OrganizationFilterBackend`, ending with the id keeps filtered pages
+        # of the cursor pagination (ordered by id) on the index
+        indexes = [
+            models.Index(fields=['country', 'industry', 'id'], name='organization_country_industry'),
+            models.Index(fields=['founded'], name='organization_founded'),
+            models.Index(fields=['number_of_employees'], name='organization_employees'),
+            GinIndex(fields=['search_vector'], name='organization_search_vector'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='organization_name_trigram'),
+        ]
+
     def __str__(self):
         return self.name
+
+    def compute_content_hash(self):
+        """
+        MD5 of the length-prefixed text of every field, NULLs as empty text.
+        """
+        payload = []
+        for name in self.CONTENT_HASH_FIELDS:
+            value = getattr(self, name)
+            value = '' if value is None else value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            payload.append(f'{len(value)}:{value}')
+        return uuid.UUID(hashlib.md5(''.join(payload).encode()).hexdigest())
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+
+
+class OrganizationStats(models.Model):
+    """
+    Number of organizations and their total employees per country, industry and founding decade.
+    Triggers on the organizations table log every change in `OrganizationStatsDelta`, the deltas are folded
+    in by `stats.refresh_organization_stats`.
+    """
+    # No foreign key constraints: rows of deleted countries or industries are folded down to zero and removed
+    country = models.ForeignKey(
+        Country, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    industry = models.ForeignKey(Industry, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    decade = models.SmallIntegerField(null=True)
+    organizations = models.BigIntegerField(default=0)
+    employees = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['country', 'industry', 'decade'], name='unique_organization_stats', nulls_distinct=False
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.country_id}/{self.industry_id}/{self.decade}: {self.organizations}'
+
+
+class OrganizationStatsDelta(models.Model):
+    """
+    Change of `OrganizationStats` made by a statement on the organizations table, not folded in yet.
+    """
+    country = models.ForeignKey(
+        Country, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    industry = models.ForeignKey(
+        Industry, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    decade = models.SmallIntegerField(null=True)
+    organizations = models.BigIntegerField()
+    employees = models.BigIntegerField()
+
+
+class DigestJob(models.Model):
+
+    class State(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        SUCCEEDED = 'succeeded', 'Succeeded'
+        FAILED = 'failed', 'Failed'
+
+    file_path = models.CharField(max_length=255)
+    loader = models.CharField(max_length=10, default='bulk')
+    parser = models.CharField(max_length=10, default='python')
+    # Which occurrence of an id repeated in the file is digested, see `duplicates.find_duplicate_rows`
+    duplicate_policy = models.CharField(max_length=10, default='last')
+    # "snapshot" jobs are full imports: organizations missing from their file are deleted once they are done
+    mode = models.CharField(max_length=10, default='upsert')
+    # Chosen when the job is planned if not given, see `scheduling.adaptive_rows_per_chunk`
+    rows_per_task = models.PositiveIntegerField(null=True)
+    state = models.CharField(max_length=10, choices=State.choices, default=State.PENDING)
+    # Chunks of higher priority jobs are consumed first, see `scheduling.job_priority`
+    priority = models.PositiveSmallIntegerField(default=0)
+    # Chunks queued or running at most, adjusted as chunks complete, see `scheduling.next_inflight_limit`
+    inflight_limit = models.FloatField(null=True)
+    # Fastest time per row of a chunk of the job, the latency other chunks are compared to
+    baseline_row_seconds = models.FloatField(null=True)
+
+    total_rows = models.PositiveBigIntegerField(null=True)
+    processed_rows = models.PositiveBigIntegerField(default=0)
+    created = models.PositiveBigIntegerField(default=0)
+    updated = models.PositiveBigIntegerField(default=0)
+    unchanged = models.PositiveBigIntegerField(default=0)
+    duplicates = models.PositiveBigIntegerField(default=0)
+    errors = models.PositiveBigIntegerField(default=0)
+    deleted = models.PositiveBigIntegerField(default=0)
+    stored_errors = models.PositiveBigIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f'{self.file_path} ({self.state})'
+
+
+class DigestChunk(models.Model):
+    """
+    Checkpoint of a chunk of a digest job, see `chunking.CsvChunk`.
+    `processed_rows` and the counters only move in the same transaction as the rows they account for.
+    """
+
+    class State(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    job = models.ForeignKey(DigestJob, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    # The uploaded file, or the decompressed copy of a compressed one (see `chunking.plan_chunks`)
+    path = models.CharField(max_length=255)
+    # ZIP member the rows come from
+    member = models.CharField(max_length=255, null=True)
+    start_offset = models.PositiveBigIntegerField()
+    end_offset = models.PositiveBigIntegerField(null=True)
+    header = models.JSONField(default=list)
+    rows = models.PositiveIntegerField(null=True)
+    first_row = models.PositiveBigIntegerField(default=1)
+    # [position, organization id] of the rows of the chunk left out as duplicates, in file order
+    duplicate_rows = models.JSONField(default=list)
+    state = models.CharField(max_length=10, choices=State.choices, default=State.PENDING)
+    # Incremented on every claim, only the last claimer may checkpoint the chunk
+    attempts = models.PositiveIntegerField(default=0)
+
+    processed_rows = models.PositiveBigIntegerField(default=0)
+    created = models.PositiveBigIntegerField(default=0)
+    updated = models.PositiveBigIntegerField(default=0)
+    unchanged = models.PositiveBigIntegerField(default=0)
+    duplicates = models.PositiveBigIntegerField(default=0)
+    errors = models.PositiveBigIntegerField(default=0)
+
+    queued_at = models.DateTimeField(null=True)
+    started_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='unique_digest_chunk_index'),
+        ]
+        indexes = [
+            models.Index(fields=['state', 'heartbeat_at'], name='digest_chunk_state_heartbeat'),
+        ]
+
+    def __str__(self):
+        return f'{self.job_id}#{self.index} ({self.state})'
+
+
+class DigestError(models.Model):
+    """
+    Error of a row that could not be digested, see `ingestion.RowError`. Row numbers count from the start of
+    the `member` of a ZIP archive the row comes from.
+    Only the first `DIGEST_MAX_STORED_ERRORS` of a job are kept, the job counts them in `stored_errors`.
+    """
+    job = models.ForeignKey(DigestJob, on_delete=models.CASCADE, related_name='error_records')
+    member = models.CharField(max_length=255, null=True)
+    row_number = models.PositiveBigIntegerField(null=True)
+    organization_id = models.TextField(null=True)
+    field = models.CharField(max_length=50, blank=True)
+    message = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job', 'member', 'row_number'], name='digest_error_job_member_row'),
+        ]
+
+    def __str__(self):
+        return self.message
@@ -0,0 +1,183 @@
+# pooled_postgresql/base.py
+import os
+import threading
+import time
+from functools import partial
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql import base
+
+from orgdigestor.metrics import DB_POOL_CONNECTIONS, DB_POOL_CONNECTS, DB_POOL_TIMEOUTS, DB_POOL_WAIT_SECONDS
+
+try:
+    from gevent import monkey, socket as gevent_socket
+except ImportError:
+    gevent_socket = None
+
+DEFAULT_POOL_OPTIONS = {'max_size': 20, 'timeout': 30}
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """
+    No connection of the pool was available in time, Django raises it as an `OperationalError`.
+    """
+
+
+class ConnectionPool:
+    """
+    Bounded pool of the open connections of a process, shared by its threads, or greenlets under gevent
+    (monkey patching makes the condition cooperative).
+
+    At most `max_size` connections are open at once. A checkout reuses the last connection returned, opens a new one
+    while the pool is not full, or waits up to `timeout` seconds for one to be returned.
+    """
+
+    def __init__(self, alias, max_size, timeout):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        # Connections of a forked parent share its sockets, the child must never use nor close them
+        self.pid = os.getpid()
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def checkout(self, connect):
+        started = time.monotonic()
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._idle or self._size < self.max_size, self.timeout):
+                DB_POOL_TIMEOUTS.inc(alias=self.alias)
+                raise PoolTimeout(
+                    f'No database connection was available within {self.timeout} seconds, '
+                    f'all {self.max_size} connections of the pool are in use.'
+                )
+            connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                self._size += 1
+            self._update_gauges()
+        DB_POOL_WAIT_SECONDS.observe(time.monotonic() - started, alias=self.alias)
+
+        if connection is not None:
+            return connection
+        try:
+            connection = connect()
+        except BaseException:
+            self.discard()
+            raise
+        DB_POOL_CONNECTS.inc(alias=self.alias)
+        return connection
+
+    def checkin(self, connection):
+        """
+        Take a connection back, rolling back its open transaction. Broken connections are closed instead.
+        """
+        try:
+            status = extensions.TRANSACTION_STATUS_UNKNOWN if connection.closed else connection.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                raise psycopg2.InterfaceError('connection already closed')
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            self.discard(connection)
+            return
+        with self._condition:
+            self._idle.append(connection)
+            self._update_gauges()
+            self._condition.notify()
+
+    def discard(self, connection=None):
+        """
+        Close a connection checked out of the pool (or account one that could not be opened) and free its place.
+        """
+        if connection is not None:
+            try:
+                connection.close()
+            except psycopg2.Error:
+                pass
+        with self._condition:
+            self._size -= 1
+            self._update_gauges()
+            self._condition.notify()
+
+    def _update_gauges(self):
+        DB_POOL_CONNECTIONS.set(len(self._idle), alias=self.alias, state='idle')
+        DB_POOL_CONNECTIONS.set(self._size - len(self._idle), alias=self.alias, state='in_use')
+
+
+# (alias, database, user, host, port) -> pool of this process
+POOLS = {}
+_pools_lock = threading.Lock()
+# Pools inherited from a forked parent, kept so their connections are never closed from this process
+_inherited_pools = []
+
+
+def get_pool(alias, settings_dict):
+    key = (alias, *(settings_dict[name] for name in ('NAME', 'USER', 'HOST', 'PORT')))
+    with _pools_lock:
+        pool = POOLS.get(key)
+        if pool is not None and pool.pid != os.getpid():
+            _inherited_pools.append(pool)
+            pool = None
+        if pool is None:
+            options = {**DEFAULT_POOL_OPTIONS, **settings_dict['OPTIONS'].get('pool', {})}
+            pool = POOLS[key] = ConnectionPool(alias, **options)
+        return pool
+
+
+def gevent_wait_callback(connection, timeout=None):
+    """
+    Wait for the server through the gevent hub, so a query only blocks the greenlet that runs it.
+    """
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            gevent_socket.wait_read(connection.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            gevent_socket.wait_write(connection.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f'Bad result from poll: {state}')
+
+
+def install_wait_callback():
+    """
+    Make psycopg2 cooperative when the process is monkey patched by gevent, like Celery's gevent pool does.
+    psycopg2 does not run COPY with a wait callback, bulk writes go through `unnest` arrays instead.
+    """
+    if gevent_socket is not None and monkey.is_module_patched('socket') and extensions.get_wait_callback() is None:
+        extensions.set_wait_callback(gevent_wait_callback)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend whose connections are checked out of a pool of the process, see `ConnectionPool`,
+    and go back to it when Django closes them (after each request and Celery task).
+    The pool is configured by `OPTIONS['pool']`, with the keys of `DEFAULT_POOL_OPTIONS`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        install_wait_callback()
+        self.pool = get_pool(self.alias, self.settings_dict)
+        return self.pool.checkout(partial(super().get_new_connection, conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self.pool.pid != os.getpid():
+            # Inherited from a forked parent, which still uses it
+            return
+        if self.in_atomic_block:
+            # Django holds on to a connection closed inside an atomic block until the block exits
+            self.pool.discard(self.connection)
+        else:
+            self.pool.checkin(self.connection)
@@ -0,0 +1,76 @@
+# scheduling.py
+import math
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Sum
+
+from orgdigestor.models import DigestChunk
+
+# Chunks whose throughput is averaged to size the chunks of a new job
+THROUGHPUT_SAMPLE_CHUNKS = 50
+
+LOCK_WAITS_SQL = """
+SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND wait_event_type = 'Lock'
+"""
+
+
+def measured_rows_per_second(loader, parser):
+    """
+    Rows per second of the last chunks digested with the same loader and parser in a single attempt,
+    `DIGEST_DEFAULT_ROWS_PER_SECOND` until there are some.
+    """
+    recent_chunks = DigestChunk.objects.filter(
+        job__loader=loader, job__parser=parser, state=DigestChunk.State.DONE, attempts=1,
+        started_at__isnull=False, processed_rows__gt=0,
+    ).order_by('-finished_at')[:THROUGHPUT_SAMPLE_CHUNKS]
+    totals = DigestChunk.objects.filter(pk__in=recent_chunks.values('pk')).aggregate(
+        rows=Sum('processed_rows'), duration=Sum(F('finished_at') - F('started_at')),
+    )
+    if not totals['rows'] or not totals['duration'] or not totals['duration'].total_seconds():
+        return settings.DIGEST_DEFAULT_ROWS_PER_SECOND
+    return totals['rows'] / totals['duration'].total_seconds()
+
+
+def adaptive_rows_per_chunk(estimated_rows, rows_per_second):
+    """
+    Rows of a chunk digested in about `DIGEST_TARGET_CHUNK_SECONDS`, but small enough for the file to be spread
+    over `DIGEST_MIN_CHUNKS_PER_JOB` chunks, within `DIGEST_CHUNK_ROWS_RANGE`.
+    """
+    min_rows, max_rows = settings.DIGEST_CHUNK_ROWS_RANGE
+    rows = rows_per_second * settings.DIGEST_TARGET_CHUNK_SECONDS
+    rows = min(rows, math.ceil(estimated_rows / settings.DIGEST_MIN_CHUNKS_PER_JOB))
+    return int(min(max(rows, min_rows), max_rows))
+
+
+def job_priority(estimated_rows):
+    """
+    Message priority of the chunks of a job, one less per order of magnitude of rows: 9 up to 10 000 rows,
+    5 from 100 million. Small uploads are not stuck behind the chunks of a huge one.
+    """
+    magnitude = math.floor(math.log10(max(estimated_rows, 1)))
+    return min(max(13 - magnitude, 5), 9)
+
+
+def lock_waits():
+    """
+    Sessions of the database waiting on a lock.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(LOCK_WAITS_SQL)
+        return cursor.fetchone()[0]
+
+
+def next_inflight_limit(inflight_limit, row_seconds, baseline_row_seconds, waiting_on_locks):
+    """
+    Additive increase, multiplicative decrease of the chunks a job may have in flight, after one of them completed.
+
+    The limit is halved when the chunk was `DIGEST_SLOW_CHUNK_FACTOR` times slower per row than the fastest chunk of
+    the job (the database is saturated) or when more than `DIGEST_MAX_LOCK_WAITS` sessions wait on locks. Otherwise
+    it grows by one chunk per limit's worth of completed chunks, up to `DIGEST_MAX_INFLIGHT_CHUNKS`.
+    """
+    if (
+        row_seconds > baseline_row_seconds * settings.DIGEST_SLOW_CHUNK_FACTOR
+        or waiting_on_locks > settings.DIGEST_MAX_LOCK_WAITS
+    ):
+        return max(inflight_limit / 2, 1)
+    return min(inflight_limit + 1 / inflight_limit, settings.DIGEST_MAX_INFLIGHT_CHUNKS)
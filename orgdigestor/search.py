@@ -0,0 +1,23 @@
+# search.py
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q
+
+from orgdigestor.models import SEARCH_CONFIG
+
+# Matches ranked per search, past it common keywords are ranked among an arbitrary subset of their matches
+SEARCH_MAX_CANDIDATES = 10000
+
+
+def search_organizations(queryset, text, limit):
+    """
+    Best ranked organizations of the queryset for the keywords in `text` (web search syntax: quotes, "or", "-").
+
+    Organizations match on the full-text `search_vector` (names weigh more than descriptions) or on the trigram
+    similarity of the keywords to words of their name, so misspelled names still match. Both go through their
+    GIN index, only up to `SEARCH_MAX_CANDIDATES` matches are ranked.
+    """
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    candidates = queryset.filter(Q(search_vector=query) | Q(name__trigram_word_similar=text)).values('pk')
+    return queryset.filter(pk__in=candidates[:SEARCH_MAX_CANDIDATES]).annotate(
+        rank=SearchRank(F('search_vector'), query) + TrigramWordSimilarity(text, 'name')
+    ).order_by('-rank', 'id')[:limit]
@@ -1,13 +1,27 @@
 from rest_framework import serializers
 
-from orgdigestor.models import Organization
+from orgdigestor.models import Organization, DigestJob
 
 
 class OrganizationSerializer(serializers.ModelSerializer):
+    country_name = serializers.CharField(source='country.name', read_only=True)
+    industry_name = serializers.CharField(source='industry.name', read_only=True)
+    # Relation -> field with its name, only included for the relations in the `expand` context
+    EXPANDABLE_FIELDS = {'country': 'country_name', 'industry': 'industry_name'}
 
     class Meta:
         model = Organization
-        fields = ('id', 'name', 'country', 'industry', 'website', 'description', 'founded', 'number_of_employees')
+        fields = (
+            'id', 'name', 'country', 'country_name', 'industry', 'industry_name', 'website', 'description', 'founded',
+            'number_of_employees',
+        )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get('expand', ())
+        for relation, field_name in self.EXPANDABLE_FIELDS.items():
+            if relation not in expand:
+                self.fields.pop(field_name)
 
     def to_internal_value(self, data):
         founded_str = data.get('founded')
@@ -18,14 +32,117 @@ class OrganizationSerializer(serializers.ModelSerializer):
 
 class OrganizationsFileDigestSerializer(serializers.Serializer):
     file = serializers.FileField(
-        help_text='File to digest, a CSV file with organizations data. Zip files are also accepted.',
+        help_text='File to digest, a CSV file with organizations data. '
+                  'Gzipped CSV files (.csv.gz) and Zip files with one or more CSV files are also accepted.',
         allow_empty_file=False,
         allow_null=False,
         required=True,
         use_url=False,
     )
     rows_per_task = serializers.IntegerField(
-        help_text='Number of rows to digest from the file. If not provided, all rows will be digested.',
-        default=10000,
+        help_text='Number of rows digested per task. If not provided, it is chosen from the size of the file and '
+                  'the throughput of previous jobs.',
+        required=False,
+        allow_null=True,
+        default=None,
+        min_value=1,
+    )
+    loader = serializers.ChoiceField(
+        help_text='How rows are loaded: "bulk" digests chunks of rows in parallel tasks, '
+                  '"copy" stages each chunk in a table and merges it at once (fewer writes on very large files).',
+        choices=(('bulk', 'Bulk upserts per batch'), ('copy', 'Staging table merged per chunk')),
+        default='bulk',
+    )
+    parser = serializers.ChoiceField(
+        help_text='How chunks are parsed: "python" reads and validates row by row, '
+                  '"columnar" validates whole columns at once with Arrow (faster on large files).',
+        choices=(('python', 'Row by row'), ('columnar', 'Column arrays')),
+        default='python',
+    )
+    duplicate_policy = serializers.ChoiceField(
+        help_text='Which occurrence of an organization id repeated in the file is digested: "last", "first", or none '
+                  'with "reject", which reports every occurrence as an error. Each organization is written once.',
+        choices=(('last', 'Last occurrence'), ('first', 'First occurrence'), ('reject', 'No occurrence')),
+        default='last',
+    )
+    mode = serializers.ChoiceField(
+        help_text='"upsert" creates and updates organizations, "snapshot" treats the file as the full list of '
+                  'organizations: the ones missing from it are deleted once the file is digested.',
+        choices=(('upsert', 'Create or update'), ('snapshot', 'Full snapshot')),
+        default='upsert',
+    )
+
+
+class OrganizationQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the organization list and export, see `filters.OrganizationFilterBackend`.
+    """
+    country = serializers.CharField(required=False, help_text='Name of the country.')
+    industry = serializers.CharField(required=False, help_text='Name of the industry.')
+    founded_after = serializers.DateField(required=False, help_text='Founded on or after this date (YYYY-MM-DD).')
+    founded_before = serializers.DateField(required=False, help_text='Founded on or before this date (YYYY-MM-DD).')
+    min_employees = serializers.IntegerField(required=False, help_text='Minimum number of employees.')
+    max_employees = serializers.IntegerField(required=False, help_text='Maximum number of employees.')
+    expand = serializers.MultipleChoiceField(
+        required=False,
+        choices=list(OrganizationSerializer.EXPANDABLE_FIELDS),
+        help_text='Relations whose name is embedded in the results, comma separated: "country", "industry".',
+    )
+
+    def to_internal_value(self, data):
+        data = data.copy()
+        if 'expand' in data:
+            data.setlist('expand', [name for value in data.getlist('expand') for name in value.split(',') if name])
+        return super().to_internal_value(data)
+
+
+class OrganizationSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(help_text='Keywords, matched against names and descriptions, names also fuzzily.')
+    limit = serializers.IntegerField(
+        help_text='Number of results, best ranked first.', default=10, min_value=1, max_value=100
+    )
+
+
+class OrganizationStatsQuerySerializer(serializers.Serializer):
+    group_by = serializers.MultipleChoiceField(
+        choices=['country', 'industry', 'decade'],
+        required=False,
+        help_text='Dimensions to group by, comma separated: "country", "industry", "decade" (all by default).',
     )
+    country = serializers.CharField(required=False, help_text='Name of the country.')
+    industry = serializers.CharField(required=False, help_text='Name of the industry.')
+    decade = serializers.IntegerField(required=False, help_text='Founding decade, e.g. 1990.')
+
+    def to_internal_value(self, data):
+        data = data.copy()
+        if 'group_by' in data:
+            data.setlist('group_by', [name for value in data.getlist('group_by') for name in value.split(',') if name])
+        return super().to_internal_value(data)
 
+    def validate_group_by(self, value):
+        return value or {'country', 'industry', 'decade'}
+
+
+class OrganizationStatsSerializer(serializers.Serializer):
+    """
+    A row of `stats.organization_stats`, dimensions that are not grouped by are left out.
+    """
+    country = serializers.CharField(source='country__name', required=False)
+    industry = serializers.CharField(source='industry__name', required=False)
+    decade = serializers.IntegerField(required=False)
+    organizations = serializers.IntegerField(source='total_organizations')
+    employees = serializers.IntegerField(source='total_employees')
+
+
+class DigestJobSerializer(serializers.ModelSerializer):
+    error_report = serializers.HyperlinkedIdentityField(view_name='digestjob-errors')
+
+    class Meta:
+        model = DigestJob
+        fields = (
+            'id', 'file_path', 'loader', 'parser', 'rows_per_task', 'priority', 'inflight_limit', 'state',
+            'duplicate_policy', 'mode', 'total_rows', 'processed_rows', 'created', 'updated', 'unchanged',
+            'duplicates', 'errors', 'deleted', 'stored_errors', 'error_report', 'created_at', 'started_at',
+            'finished_at',
+        )
+        read_only_fields = fields
@@ -0,0 +1,93 @@
+# snapshot.py
+import pyarrow.compute as pc
+from django.db import connection
+
+from orgdigestor.ingestion import DIGEST_BATCH_ROWS
+from orgdigestor.models import Organization
+
+# Table of the ids of a snapshot job is this prefix followed by the job id
+SNAPSHOT_TABLE_PREFIX = 'orgdigestor_snapshot_ids_'
+
+DELETE_MISSING_SQL = """
+WITH deleted AS (
+    DELETE FROM {organization_table} AS organization
+    WHERE NOT EXISTS (SELECT FROM {snapshot_table} AS snapshot WHERE snapshot.id = organization.id)
+    RETURNING 1
+)
+SELECT count(*) FROM deleted
+"""
+
+
+class IncompleteSnapshot(Exception):
+    """
+    The ids recorded for a snapshot job do not cover the rows it digested, no organization is deleted.
+    """
+
+
+def snapshot_table(job_id):
+    return f'{SNAPSHOT_TABLE_PREFIX}{int(job_id)}'
+
+
+def record_snapshot_ids(job_id, chunk_ids):
+    """
+    Record the organization ids of the rows of a snapshot job (the `read_chunk_ids` of each chunk) in a table
+    of their own, inserted `DIGEST_BATCH_ROWS` at a time. It outlives the transaction, chunks are digested meanwhile.
+    Ids of invalid rows are recorded too, an organization whose row is broken in the snapshot is kept.
+    """
+    table = snapshot_table(job_id)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        cursor.execute(f'CREATE TABLE {table} (id text NOT NULL)')
+        for ids in chunk_ids:
+            # Postgres text cannot hold NUL characters, see `storable_text` (no organization has such an id)
+            ids = pc.replace_substring(pc.drop_null(ids), '\x00', '\ufffd')
+            for start in range(0, len(ids), DIGEST_BATCH_ROWS):
+                cursor.execute(
+                    f'INSERT INTO {table} (id) SELECT unnest(%s::text[])',
+                    [ids.slice(start, DIGEST_BATCH_ROWS).to_pylist()],
+                )
+        # Fresh statistics let the planner pick a hash anti-join, see `delete_missing_organizations`
+        cursor.execute(f'ANALYZE {table}')
+
+
+def delete_missing_organizations(job_id, digested_rows):
+    """
+    Delete the organizations whose id is not in the snapshot of a job with a single anti-join, then drop the
+    recorded ids. Return the number of organizations deleted.
+
+    Raise `IncompleteSnapshot` when no ids or fewer than the `digested_rows` of the job (every valid row has an id)
+    were recorded: a header-only file or a broken scan would otherwise delete the organizations it should keep.
+    """
+    table = snapshot_table(job_id)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {table}')
+        recorded_ids = cursor.fetchone()[0]
+        if not recorded_ids or recorded_ids < digested_rows:
+            raise IncompleteSnapshot(
+                f'The snapshot of job {job_id} recorded {recorded_ids} ids for {digested_rows} digested rows, '
+                f'no organization was deleted.'
+            )
+        cursor.execute(DELETE_MISSING_SQL.format(
+            organization_table=Organization._meta.db_table, snapshot_table=table,
+        ))
+        deleted = cursor.fetchone()[0]
+        cursor.execute(f'DROP TABLE {table}')
+    return deleted
+
+
+def drop_orphaned_snapshots(needed_job_ids):
+    """
+    Drop the recorded ids of the snapshot jobs not in `needed_job_ids`, which will never finish.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE %s',
+            [SNAPSHOT_TABLE_PREFIX.replace('_', r'\_') + '%'],
+        )
+        tables = [
+            table for (table,) in cursor.fetchall()
+            if int(table.removeprefix(SNAPSHOT_TABLE_PREFIX)) not in needed_job_ids
+        ]
+        for table in tables:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    return len(tables)
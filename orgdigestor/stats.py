@@ -0,0 +1,58 @@
+# stats.py
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from orgdigestor.models import OrganizationStats
+
+# Group by parameter -> lookup of the `OrganizationStats` dimension
+STATS_DIMENSIONS = {
+    'country': 'country__name',
+    'industry': 'industry__name',
+    'decade': 'decade',
+}
+
+REFRESH_STATS_SQL = """
+WITH folded AS (
+    DELETE FROM orgdigestor_organizationstatsdelta
+    RETURNING country_id, industry_id, decade, organizations, employees
+)
+INSERT INTO orgdigestor_organizationstats (country_id, industry_id, decade, organizations, employees)
+SELECT country_id, industry_id, decade, sum(organizations), sum(employees)
+FROM folded
+GROUP BY country_id, industry_id, decade
+ORDER BY country_id, industry_id, decade
+ON CONFLICT (country_id, industry_id, decade) DO UPDATE SET
+    organizations = orgdigestor_organizationstats.organizations + EXCLUDED.organizations,
+    employees = orgdigestor_organizationstats.employees + EXCLUDED.employees
+RETURNING id, organizations
+"""
+
+
+def refresh_organization_stats():
+    """
+    Fold the logged deltas into `OrganizationStats`, the work depends on the rows written since the last refresh,
+    not on the size of the organizations table. Deltas are deleted as they are folded, so concurrent refreshes
+    never fold one twice.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(REFRESH_STATS_SQL)
+        emptied = [stats_id for stats_id, organizations in cursor.fetchall() if organizations == 0]
+        OrganizationStats.objects.filter(id__in=emptied).delete()
+
+
+def organization_stats(group_by, country=None, industry=None, decade=None):
+    """
+    Number of organizations and total employees per combination of the `group_by` dimensions,
+    summed from the rollup rows (not from the organizations table).
+    """
+    dimensions = [lookup for name, lookup in STATS_DIMENSIONS.items() if name in group_by]
+    queryset = OrganizationStats.objects.all()
+    if country is not None:
+        queryset = queryset.filter(country__name=country)
+    if industry is not None:
+        queryset = queryset.filter(industry__name=industry)
+    if decade is not None:
+        queryset = queryset.filter(decade=decade)
+    return queryset.values(*dimensions).annotate(
+        total_organizations=Sum('organizations'), total_employees=Sum('employees')
+    ).order_by(*dimensions)
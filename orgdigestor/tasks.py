@@ -1,164 +1,589 @@
 # tasks.py
-import csv
+import itertools
 import os
-from dataclasses import dataclass, field, asdict
-from celery import shared_task, group
-from django.utils.text import slugify
+import time
+from dataclasses import asdict
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.db import DatabaseError, DataError, ProgrammingError, connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce, Now
+from django.urls import reverse
+from django.utils import timezone
+
+from orgdigestor.chunking import (
+    CsvChunk, chunk_read_bytes, estimate_rows, is_ndjson_file, plan_chunks, read_csv_chunk, read_ndjson_chunk,
+)
+from orgdigestor.columnar import iter_chunk_batches, parse_batch
+from orgdigestor.copy_loader import load_csv_with_copy
+from orgdigestor.duplicates import find_duplicate_rows, read_chunk_ids, report_duplicate_rows, rows_between
+from orgdigestor.ingestion import (
+    BULK_BATCH_SIZE, CSV_COLUMNS, DIGEST_BATCH_ROWS, OrganizationDigestReport, RowError, csv_value,
+    digest_validated_rows, drop_positions, merge_reports, restore_positions, row_validator, storable_text,
+    validate_ndjson_lines,
+)
+from orgdigestor.metrics import (
+    DIGEST_CHUNK_QUERIES, DIGEST_CHUNK_QUEUE_SECONDS, DIGEST_CHUNK_ROWS_PER_SECOND, DIGEST_CHUNK_SECONDS,
+    DIGEST_READ_BYTES, DIGEST_STAGE_SECONDS, count_digest_rows, count_queries, profile_chunk,
+)
+from orgdigestor.models import DigestChunk, DigestError, DigestJob
+from orgdigestor.scheduling import (
+    adaptive_rows_per_chunk, job_priority, lock_waits, measured_rows_per_second, next_inflight_limit,
+)
+from orgdigestor.snapshot import (
+    IncompleteSnapshot, delete_missing_organizations, drop_orphaned_snapshots, record_snapshot_ids,
+)
+from orgdigestor.stats import refresh_organization_stats
 
-from orgdigestor.models import Organization, Country, Industry
-from orgdigestor.serializers import OrganizationSerializer
+
+def map_org_row(row_dict):
+    return {field_name: csv_value(field_name, row_dict.get(column)) for column, field_name in CSV_COLUMNS.items()}
 
 
-@dataclass
-class OrganizationDigestReport:
-    created: int = 0
-    updated: int = 0
-    errors: int = 0
-    error_messages: list[str] = field(default_factory=list)
+def iter_batches(items, size=DIGEST_BATCH_ROWS):
+    items = iter(items)
+    while batch := list(itertools.islice(items, size)):
+        yield batch
 
 
-def split_csv_file(file_path, rows_per_file):
+def parse_chunk_batches(chunk, parser='python', duplicate_rows=()):
     """
-    Split a CSV file into multiple files with a maximum number of rows.
+    Yield the (valid rows, invalid rows, number of rows) of each batch of a chunk.
+    The "python" parser reads and validates row by row, the "columnar" one validates whole columns of
+    a batch at once, see `columnar.parse_batch`. Both give the same rows and errors.
+    NDJSON files are always read line by line, see `validate_ndjson_lines`.
+    The `duplicate_rows` of the chunk (see `find_duplicate_rows`) are counted but neither validated nor returned.
+
+    Reading a batch is timed as the "parse" stage and validating it as the "validate" one
+    (the columnar parser parses the CSV records of the batch while validating it).
+    """
+    offset = 0
+    if is_ndjson_file(chunk['path']):
+        batches, validate = iter_batches(read_ndjson_chunk(chunk)), validate_ndjson_lines
+    elif parser == 'columnar':
+        for data in DIGEST_STAGE_SECONDS.time_each(iter_chunk_batches(chunk, DIGEST_BATCH_ROWS), stage='parse'):
+            skip_positions = {
+                position - offset for position, _ in rows_between(duplicate_rows, offset, offset + DIGEST_BATCH_ROWS)
+            }
+            with DIGEST_STAGE_SECONDS.time(stage='validate'):
+                valid_rows, invalid_rows, rows = parse_batch(data, chunk['header'], skip_positions)
+            offset += rows
+            yield valid_rows, invalid_rows, rows
+        return
+    else:
+        batches = iter_batches(map_org_row(row) for row in read_csv_chunk(chunk))
+        validate = row_validator.validate_many
+
+    for batch in DIGEST_STAGE_SECONDS.time_each(batches, stage='parse'):
+        skip_positions = {
+            position - offset for position, _ in rows_between(duplicate_rows, offset, offset + len(batch))
+        }
+        offset += len(batch)
+        with DIGEST_STAGE_SECONDS.time(stage='validate'):
+            kept_rows, kept_positions = drop_positions(batch, skip_positions)
+            valid_rows, invalid_rows = validate(kept_rows)
+        yield valid_rows, restore_positions(invalid_rows, kept_positions), len(batch)
+
+
+# Errors a retry would hit again, e.g. a value out of range of its column or a broken query
+PERMANENT_DATABASE_ERRORS = (DataError, ProgrammingError)
+
+
+class DigestChunkClaimLost(Exception):
+    """
+    The chunk was claimed again by another task (see `sweep_digest_jobs`), this one must stop.
     """
-    with open(file_path, mode='r') as file:
-        reader = csv.DictReader(file)
-        headers = reader.fieldnames
-
-        batch = []
-        batch_number = 0
-        batch_files = []
-
-        for i, row in enumerate(reader):
-            if i % rows_per_file == 0:
-                if batch:
-                    batch_files.append(write_batch_to_file(batch, headers, batch_number, file_path))
-                    batch = []
-                    batch_number += 1
-            batch.append(row)
 
-        if batch:
-            batch_files.append(write_batch_to_file(batch, headers, batch_number, file_path))
 
-        return batch_files
+def progress_updates(digest_report, rows):
+    return {
+        'processed_rows': F('processed_rows') + rows,
+        'created': F('created') + digest_report.created,
+        'updated': F('updated') + digest_report.updated,
+        'unchanged': F('unchanged') + digest_report.unchanged,
+        'duplicates': F('duplicates') + digest_report.duplicates,
+        'errors': F('errors') + digest_report.errors,
+    }
 
 
-def write_batch_to_file(batch, headers, batch_number, file_path):
+def plan_digest_chunks(job):
+    """
+    Plan the chunks of a job once and record them, see `plan_chunks`. Compressed uploads are decompressed to
+    the data directory first, so they are cut into chunks like plain files.
+    Jobs without `rows_per_task` get chunks sized from the file and the measured throughput,
+    see `adaptive_rows_per_chunk`, and every job gets a priority from its size.
+    Ids repeated in the file are resolved across chunks by the job's `duplicate_policy`, see `find_duplicate_rows`,
+    and the ids of a snapshot job are recorded, see `record_snapshot_ids`.
+    """
+    estimated_rows = estimate_rows(job.file_path)
+    if job.rows_per_task is None:
+        job.rows_per_task = adaptive_rows_per_chunk(estimated_rows, measured_rows_per_second(job.loader, job.parser))
+    chunks = plan_chunks(
+        job.file_path, job.rows_per_task, os.path.join(settings.DIGEST_DATA_DIR, f'digest-job-{job.pk}')
+    )
+    with DIGEST_STAGE_SECONDS.time(stage='dedup'):
+        chunk_ids = [read_chunk_ids(asdict(chunk)) for chunk in chunks]
+        duplicate_rows = find_duplicate_rows(chunk_ids, job.duplicate_policy)
+    if job.mode == 'snapshot':
+        record_snapshot_ids(job.pk, chunk_ids)
+    DigestChunk.objects.bulk_create(
+        [
+            DigestChunk(job=job, index=index, duplicate_rows=duplicate_rows[index], **asdict(chunk))
+            for index, chunk in enumerate(chunks)
+        ],
+        ignore_conflicts=True,
+    )
+    total_rows = None
+    if all(chunk.rows is not None for chunk in chunks):
+        total_rows = sum(chunk.rows for chunk in chunks)
+    DigestJob.objects.filter(pk=job.pk).update(
+        rows_per_task=job.rows_per_task,
+        total_rows=total_rows,
+        priority=job_priority(total_rows or estimated_rows),
+        inflight_limit=settings.DIGEST_INITIAL_INFLIGHT_CHUNKS,
+    )
+
+
+def queue_digest_chunks(chunk_ids, priority):
     """
-    Write a batch of rows to a new CSV file.
+    Mark the chunks as queued and send them with the given priority once the transaction commits.
     """
-    file_name, file_extension = os.path.splitext(file_path)
-    new_file_path = f'{file_name}_batch_{batch_number}{file_extension}'
+    DigestChunk.objects.filter(pk__in=chunk_ids).update(queued_at=timezone.now())
 
-    with open(new_file_path, mode='w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=headers)
-        writer.writeheader()
-        writer.writerows(batch)
+    def send():
+        for chunk_id in chunk_ids:
+            process_csv_chunk.apply_async((chunk_id,), priority=priority)
 
-    return new_file_path
+    transaction.on_commit(send)
 
 
-def map_org_row(row_dict):
-    return {
-        'id': row_dict.get('Organization Id'),
-        'name': row_dict.get('Name'),
-        'country': row_dict.get('Country'),
-        'industry': row_dict.get('Industry'),
-        'website': row_dict.get('Website'),
-        'description': row_dict.get('Description'),
-        'founded': row_dict.get('Founded'),
-        'number_of_employees': row_dict.get('Number of employees'),
-    }
+def dispatch_digest_chunks(job_id):
+    """
+    Queue the next pending chunks of a job in file order, while less than its `inflight_limit` chunks are queued
+    or running. Called when the job starts and whenever one of its chunks completes, so a big job never floods
+    the queue ahead of the chunks of other jobs.
+    """
+    with transaction.atomic():
+        job = DigestJob.objects.select_for_update().get(pk=job_id)
+        in_flight = job.chunks.filter(
+            Q(state=DigestChunk.State.RUNNING) | Q(state=DigestChunk.State.PENDING, queued_at__isnull=False)
+        ).count()
+        inflight_limit = int(job.inflight_limit or settings.DIGEST_INITIAL_INFLIGHT_CHUNKS)
+        chunk_ids = list(job.chunks.filter(
+            state=DigestChunk.State.PENDING, queued_at__isnull=True
+        ).order_by('index').values_list('id', flat=True)[:max(inflight_limit - in_flight, 0)])
+        queue_digest_chunks(chunk_ids, job.priority)
+    return chunk_ids
+
+
+def adjust_inflight_limit(job, row_seconds):
+    """
+    Grow or shrink the chunks the job may have in flight from the time per row of a chunk that just completed,
+    see `next_inflight_limit`. The job must be locked.
+    """
+    baseline_row_seconds = min(job.baseline_row_seconds or row_seconds, row_seconds)
+    inflight_limit = next_inflight_limit(
+        job.inflight_limit or settings.DIGEST_INITIAL_INFLIGHT_CHUNKS, row_seconds, baseline_row_seconds, lock_waits(),
+    )
+    DigestJob.objects.filter(pk=job.pk).update(
+        inflight_limit=inflight_limit, baseline_row_seconds=baseline_row_seconds,
+    )
 
 
-@shared_task
-def process_organizations_csv(file_path, rows_per_task):
+def claim_digest_chunk(chunk_id):
     """
-    Start point task to process a CSV file with organizations' data.
-    The process is:
-    - Split the file into multiple files with a maximum number of rows.
-    - Process each file in a separate task.
-    - Collect the reports from each task.
-    - Send a summary report with the results (number of organizations created, updated, etc).
+    Mark a pending chunk as running and return it, or None if it is done or already taken.
     """
-    batch_files = split_csv_file(file_path, rows_per_task)
-    chunks_group = group(process_csv_chunk.s(file_path) for file_path in batch_files)
-    g = chunks_group | sum_reports.s(send_email=True)
-    return g.delay().get()
+    with transaction.atomic():
+        digest_chunk = DigestChunk.objects.select_for_update().filter(
+            pk=chunk_id, state=DigestChunk.State.PENDING
+        ).first()
+        if digest_chunk is None:
+            return None
+        digest_chunk.state = DigestChunk.State.RUNNING
+        digest_chunk.attempts += 1
+        digest_chunk.started_at = digest_chunk.heartbeat_at = timezone.now()
+        digest_chunk.save(update_fields=['state', 'attempts', 'started_at', 'heartbeat_at'])
+    if digest_chunk.queued_at is not None:
+        DIGEST_CHUNK_QUEUE_SECONDS.observe((digest_chunk.heartbeat_at - digest_chunk.queued_at).total_seconds())
+    return digest_chunk
+
+
+def hold_digest_chunk(digest_chunk):
+    """
+    Hold an advisory lock on the chunk until the end of the transaction writing its rows, so the sweeper leaves it
+    alone while it runs for longer than a checkpoint interval
+    (a chunk of the "copy" loader only checkpoints once merged).
+    The lock of a worker that died goes away with its connection, see `writing_digest_chunks`.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [digest_chunk.pk])
 
 
-@shared_task
-def process_csv_chunk(file_path):
+def writing_digest_chunks():
     """
-    Process a CSV file with organizations data.
+    Ids of the chunks whose rows are being written, see `hold_digest_chunk`.
     """
+    with connection.cursor() as cursor:
+        # The bigint key of an advisory lock is split in its high (classid) and low (objid) halves
+        cursor.execute("""
+            SELECT (classid::bigint << 32) | objid::bigint FROM pg_locks
+            WHERE locktype = 'advisory' AND objsubid = 1 AND granted
+            AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+        """)
+        return {chunk_id for (chunk_id,) in cursor.fetchall()}
 
-    with open(file_path, mode='r') as file:
-        reader = csv.DictReader(file)
-        rows_group = group(create_update_organization.s(data=map_org_row(row)) for row in reader)
-        g = rows_group | sum_reports.s()
-        digest_report = g.delay().get()
 
-    os.remove(file_path)
-    return digest_report
+def checkpoint_digest_chunk(digest_chunk, digest_report, rows):
+    """
+    Add the report of the rows just written to the chunk and its job, and store its row errors,
+    see `store_digest_errors`.
+    Must run in the transaction that wrote the rows, so a chunk never accounts rows twice.
+    """
+    with DIGEST_STAGE_SECONDS.time(stage='checkpoint'):
+        updates = progress_updates(digest_report, rows)
+        checkpointed = DigestChunk.objects.filter(
+            pk=digest_chunk.pk, state=DigestChunk.State.RUNNING, attempts=digest_chunk.attempts
+        ).update(heartbeat_at=timezone.now(), **updates)
+        if not checkpointed:
+            raise DigestChunkClaimLost(digest_chunk.pk)
+        DigestJob.objects.filter(pk=digest_chunk.job_id).update(**updates)
+        store_digest_errors(digest_chunk.job_id, digest_report.row_errors, digest_chunk.member)
+    transaction.on_commit(lambda: count_digest_rows(digest_report))
+
+
+def store_digest_errors(job_id, row_errors, member=None):
+    """
+    Store row errors of a job while it has less than `DIGEST_MAX_STORED_ERRORS` of them, the rest are only counted.
+    `member` is the ZIP archive member the rows come from, if any.
+    """
+    if not row_errors:
+        return
+    # The job row stays locked until commit, so concurrent chunks see each other's errors in turn
+    stored_errors = DigestJob.objects.select_for_update().values_list('stored_errors', flat=True).get(pk=job_id)
+    row_errors = row_errors[:max(settings.DIGEST_MAX_STORED_ERRORS - stored_errors, 0)]
+    if not row_errors:
+        return
+    DigestError.objects.bulk_create(
+        [
+            DigestError(
+                job_id=job_id, member=member, row_number=row_error.row_number,
+                organization_id=storable_text(row_error.organization_id), field=row_error.field,
+                message=row_error.message,
+            )
+            for row_error in row_errors
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    DigestJob.objects.filter(pk=job_id).update(stored_errors=F('stored_errors') + len(row_errors))
+
+
+def release_digest_chunk(digest_chunk, state=DigestChunk.State.PENDING):
+    DigestChunk.objects.filter(
+        pk=digest_chunk.pk, state=DigestChunk.State.RUNNING, attempts=digest_chunk.attempts
+    ).update(state=state)
+
+
+def complete_digest_chunk(digest_chunk, row_seconds=None, scheduled=True):
+    """
+    Mark the chunk as done. For chunks dispatched by `dispatch_digest_chunks` (`scheduled`), the time per row of
+    the chunk adjusts the chunks the job may have in flight, its next chunks are queued and the last chunk of the
+    job to complete finishes the job.
+    """
+    with transaction.atomic():
+        # Locking the job makes chunks complete one at a time, the last one sees every other chunk done
+        job = DigestJob.objects.select_for_update().get(pk=digest_chunk.job_id)
+        completed = DigestChunk.objects.filter(
+            pk=digest_chunk.pk, state=DigestChunk.State.RUNNING, attempts=digest_chunk.attempts
+        ).update(state=DigestChunk.State.DONE, finished_at=timezone.now())
+        last = completed and not DigestChunk.objects.filter(job_id=digest_chunk.job_id).exclude(
+            state=DigestChunk.State.DONE
+        ).exists()
+        if completed and scheduled and row_seconds is not None:
+            adjust_inflight_limit(job, row_seconds)
+        if completed and scheduled and not last:
+            dispatch_digest_chunks(job.pk)
+    if last and scheduled:
+        finish_digest_job(digest_chunk.job_id)
+
+
+@shared_task(ignore_result=True, acks_late=True, reject_on_worker_lost=True)
+def process_organizations_csv(job_id):
+    """
+    Start point task to process a CSV file with organizations' data.
+    The process is:
+    - Plan byte ranges of the file (of its decompressed copies for compressed CSVs) with a maximum number of rows,
+      see `plan_digest_chunks`. Chunks are recorded as `DigestChunk` checkpoints.
+    - Process each chunk in a separate task, each one adds its progress to the job. Chunks are queued a few at
+      a time as others complete, see `dispatch_digest_chunks`.
+    - Once all chunks are done, the last one finishes the job and sends a summary report with the results
+      (number of organizations created, updated, etc).
+
+    Running this task again for a job (a redelivery or a resume) only queues its unfinished chunks.
+    With the "copy" loader each chunk is staged and merged at once, see `load_csv_with_copy`.
+    """
+    if start_digest_job(job_id):
+        dispatch_digest_chunks(job_id)
+    elif not DigestChunk.objects.filter(job_id=job_id).exclude(state=DigestChunk.State.DONE).exists():
+        finish_digest_job(job_id)
 
 
-@shared_task(bind=True, retry_limit=2, default_retry_delay=5)
-def create_update_organization(self, data):
+def start_digest_job(job_id):
     """
-    Create or update an organization based on the data provided.
+    Mark the job as running, plan its chunks the first time and make its unfinished chunks pending and unqueued again.
+    Return the ids of the chunks left to process, in file order.
     """
+    job = DigestJob.objects.get(pk=job_id)
+    DigestJob.objects.filter(pk=job_id).update(
+        state=DigestJob.State.RUNNING, started_at=Coalesce('started_at', Now()), finished_at=None
+    )
+
+    if not job.chunks.exists():
+        with DIGEST_STAGE_SECONDS.time(stage='plan'):
+            plan_digest_chunks(job)
+    job.chunks.filter(state__in=[DigestChunk.State.PENDING, DigestChunk.State.FAILED]).update(
+        state=DigestChunk.State.PENDING, queued_at=None
+    )
+    return list(job.chunks.filter(state=DigestChunk.State.PENDING).order_by('index').values_list('id', flat=True))
+
+
+@shared_task(bind=True, ignore_result=True, acks_late=True, reject_on_worker_lost=True, default_retry_delay=5)
+def process_csv_chunk(self, chunk_id, scheduled=True):
+    """
+    Process a chunk of a CSV file with organizations data, as planned by `plan_digest_chunks`.
+    Rows are validated in memory and written with bulk upserts in batches, see `parse_chunk_batches`,
+    or staged and merged in one go with the "copy" loader, see `load_csv_with_copy`.
+
+    Every batch is checkpointed in the transaction that writes it, so a chunk redelivered after a crash
+    (tasks are acknowledged late) resumes after its last written batch, and a chunk already done is skipped.
+    Database errors are retried, once retries are exhausted (or at once for `PERMANENT_DATABASE_ERRORS`) a failing
+    batch is recorded as errors, and a failing merge of the "copy" loader fails the chunk and its job.
+
+    The time, rows per second and queries of the chunk are recorded in the metrics of the worker, and its call
+    stacks are sampled when a profile of it was requested, see `profile_chunk`.
+    Chunks processed outside of `dispatch_digest_chunks` (`scheduled` False, see `digest_organizations`) neither
+    queue other chunks nor finish the job.
+    """
+    try:
+        digest_chunk = claim_digest_chunk(chunk_id)
+    except DatabaseError as e:
+        # e.g. no connection of the pool was available in time
+        raise self.retry(exc=e)
+    if digest_chunk is None:
+        return
+    job = digest_chunk.job
+    chunk = asdict(CsvChunk(
+        digest_chunk.path, digest_chunk.start_offset, digest_chunk.end_offset, digest_chunk.header,
+        digest_chunk.member, digest_chunk.rows, digest_chunk.first_row,
+    ))
+    started = time.perf_counter()
+    processed_rows = 0
 
-    digest_report = OrganizationDigestReport()
     try:
-        # Create or update the organization
-        organization_id = data.pop('id')
-
-        country_name = data.get('country')
-        country, _ = Country.objects.get_or_create(name=country_name)
-        data['country'] = country.id
-
-        industry_slug = slugify(data.get('industry'))
-        try:
-            industry = Industry.objects.get(slug=industry_slug)
-        except Industry.DoesNotExist:
-            industry = Industry.objects.create(name=data.get('industry'), slug=industry_slug)
-        data['industry'] = industry.id
-
-        serializer = OrganizationSerializer(data=data)
-        serializer.is_valid(raise_exception=True)
-
-        organization, created = Organization.objects.update_or_create(
-            id=organization_id,
-            defaults=serializer.validated_data
+        with count_queries() as counter, profile_chunk(chunk_id):
+            if job.loader == 'copy':
+                with transaction.atomic():
+                    hold_digest_chunk(digest_chunk)
+                    digest_report = load_csv_with_copy(
+                        parse_chunk_batches(chunk, job.parser, digest_chunk.duplicate_rows),
+                        digest_chunk.first_row,
+                        on_row_errors=lambda row_errors: store_digest_errors(
+                            job.pk, row_errors, digest_chunk.member
+                        ),
+                    )
+                    merge_reports(digest_report, report_duplicate_rows(
+                        digest_chunk.duplicate_rows, job.duplicate_policy, digest_chunk.first_row
+                    ))
+                    processed_rows = (
+                        digest_report.created + digest_report.updated + digest_report.unchanged
+                        + digest_report.duplicates + digest_report.errors
+                    )
+                    checkpoint_digest_chunk(digest_chunk, digest_report, processed_rows)
+            else:
+                # Batches always have the same boundaries, the ones already written are skipped
+                first_row = digest_chunk.first_row
+                batches = parse_chunk_batches(chunk, job.parser, digest_chunk.duplicate_rows)
+                for valid_rows, invalid_rows, rows in batches:
+                    batch_first_row, first_row = first_row, first_row + rows
+                    if batch_first_row - digest_chunk.first_row < digest_chunk.processed_rows:
+                        continue
+                    duplicate_rows = rows_between(
+                        digest_chunk.duplicate_rows,
+                        batch_first_row - digest_chunk.first_row, first_row - digest_chunk.first_row,
+                    )
+                    try:
+                        with transaction.atomic():
+                            hold_digest_chunk(digest_chunk)
+                            batch_report = digest_validated_rows(valid_rows, invalid_rows, batch_first_row)
+                            merge_reports(batch_report, report_duplicate_rows(
+                                duplicate_rows, job.duplicate_policy, digest_chunk.first_row
+                            ))
+                            checkpoint_digest_chunk(digest_chunk, batch_report, rows)
+                    except DatabaseError as e:
+                        if self.request.retries < self.max_retries and not isinstance(e, PERMANENT_DATABASE_ERRORS):
+                            raise
+                        with transaction.atomic():
+                            batch_report = OrganizationDigestReport(errors=rows, row_errors=[
+                                RowError(batch_first_row, None, '', f'Batch of rows {batch_first_row}-{first_row - 1} failed: {e}')
+                            ])
+                            checkpoint_digest_chunk(digest_chunk, batch_report, rows)
+                    processed_rows += rows
+    except DigestChunkClaimLost:
+        return
+    except DatabaseError as e:
+        if self.request.retries < self.max_retries and not isinstance(e, PERMANENT_DATABASE_ERRORS):
+            release_digest_chunk(digest_chunk)
+            raise self.retry(exc=e)
+        release_digest_chunk(digest_chunk, DigestChunk.State.FAILED)
+        fail_digest_job(job.pk)
+        raise
+    except Exception:
+        release_digest_chunk(digest_chunk, DigestChunk.State.FAILED)
+        fail_digest_job(job.pk)
+        raise
+
+    seconds = time.perf_counter() - started
+    DIGEST_CHUNK_SECONDS.observe(seconds, loader=job.loader)
+    DIGEST_CHUNK_QUERIES.observe(counter['queries'], loader=job.loader)
+    if processed_rows and seconds:
+        DIGEST_CHUNK_ROWS_PER_SECOND.observe(processed_rows / seconds, loader=job.loader)
+    DIGEST_READ_BYTES.inc(chunk_read_bytes(chunk))
+
+    # Only whole chunks processed in one go are representative of the job's latency
+    measured = digest_chunk.attempts == 1 and processed_rows and processed_rows * 2 >= (job.rows_per_task or 0)
+    complete_digest_chunk(digest_chunk, seconds / processed_rows if measured else None, scheduled)
+
+
+@shared_task(ignore_result=True)
+def finish_digest_job(job_id):
+    """
+    Mark the job as done, fold its changes into the organization stats and send its summary report,
+    only once per job.
+    The summary comes from the job counters, chunks never return their reports.
+    Row errors are not part of it, they are downloaded from the job's error report.
+    Snapshot jobs delete the organizations missing from their file, see `delete_missing_organizations`,
+    and fail when their recorded ids do not cover their rows.
+    """
+    try:
+        with transaction.atomic():
+            finished = DigestJob.objects.filter(pk=job_id, state=DigestJob.State.RUNNING).update(
+                state=DigestJob.State.SUCCEEDED,
+                finished_at=timezone.now(),
+                total_rows=Coalesce('total_rows', 'processed_rows'),
+            )
+            if not finished:
+                return
+            job = DigestJob.objects.get(pk=job_id)
+            if job.mode == 'snapshot':
+                # In the transaction that finishes the job, so a failed deletion leaves it to be finished again
+                digested_rows = job.created + job.updated + job.unchanged + job.duplicates
+                with DIGEST_STAGE_SECONDS.time(stage='snapshot'):
+                    job.deleted = delete_missing_organizations(job_id, digested_rows)
+                job.save(update_fields=['deleted'])
+    except IncompleteSnapshot:
+        fail_digest_job(job_id)
+        raise
+    refresh_organization_stats()
+    report = OrganizationDigestReport(
+        created=job.created, updated=job.updated, unchanged=job.unchanged, duplicates=job.duplicates,
+        errors=job.errors, deleted=job.deleted,
+    )
+    error_report_url = reverse('digestjob-errors', args=[job_id]) if job.stored_errors else None
+    return sum_reports([asdict(report)], send_email=True, error_report_url=error_report_url)
+
+
+@shared_task(ignore_result=True)
+def fail_digest_job(job_id, *args):
+    DigestJob.objects.filter(pk=job_id).update(state=DigestJob.State.FAILED, finished_at=timezone.now())
+
+
+@shared_task(ignore_result=True)
+def sweep_digest_jobs():
+    """
+    Periodic task, see `CELERY_BEAT_SCHEDULE`:
+    - Requeue the chunks of running jobs that stopped checkpointing and are not being written (their worker died),
+      or that were queued long ago and never started. Chunks are claimed before being processed, so a chunk that was
+      only slow is never processed twice.
+    - Delete the uploaded files and snapshot ids no job needs anymore, see `delete_orphaned_files`.
+    - Fold the changes made outside digest jobs (e.g. through the API) into the organization stats.
+    """
+    stale_before = timezone.now() - timedelta(seconds=settings.DIGEST_CHUNK_STALE_SECONDS)
+    stale_running = Q(state=DigestChunk.State.RUNNING, heartbeat_at__lt=stale_before) & ~Q(
+        pk__in=writing_digest_chunks()
+    )
+    stale_chunks = DigestChunk.objects.filter(job__state=DigestJob.State.RUNNING).filter(
+        stale_running | Q(state=DigestChunk.State.PENDING, queued_at__lt=stale_before)
+    )
+    stale_chunk_priorities = dict(stale_chunks.values_list('id', 'job__priority'))
+    DigestChunk.objects.filter(stale_running, pk__in=stale_chunk_priorities).update(state=DigestChunk.State.PENDING)
+    for priority in set(stale_chunk_priorities.values()):
+        queue_digest_chunks(
+            [chunk_id for chunk_id, chunk_priority in stale_chunk_priorities.items() if chunk_priority == priority],
+            priority,
         )
+    deleted_files = delete_orphaned_files()
+    dropped_snapshots = drop_orphaned_snapshots(set(resumable_jobs().values_list('id', flat=True)))
+    refresh_organization_stats()
+    return {
+        'requeued_chunks': len(stale_chunk_priorities),
+        'deleted_files': deleted_files,
+        'dropped_snapshots': dropped_snapshots,
+    }
 
-        if created:
-            digest_report.created = 1
-        else:
-            digest_report.updated = 1
 
-    except Exception as e:
-        if self.request.retries < self.max_retries:
-            raise self.retry(exc=e)
-        else:
-            digest_report.errors = 1
-            digest_report.error_messages.append(str(e))
+def resumable_jobs(retention_start=None):
+    """
+    Jobs that may still run: pending or running jobs, and failed jobs that can be resumed
+    (failed after `retention_start`, `DIGEST_FILE_RETENTION_SECONDS` ago by default).
+    """
+    if retention_start is None:
+        retention_start = timezone.now() - timedelta(seconds=settings.DIGEST_FILE_RETENTION_SECONDS)
+    return DigestJob.objects.filter(
+        Q(state__in=[DigestJob.State.PENDING, DigestJob.State.RUNNING])
+        | Q(state=DigestJob.State.FAILED, finished_at__gte=retention_start)
+    )
+
 
-    return asdict(digest_report)
+def delete_orphaned_files():
+    """
+    Delete the files of the data directory older than `DIGEST_FILE_RETENTION_SECONDS`, unless a job may
+    still read them (its file or the decompressed copies its chunks read), see `resumable_jobs`.
+    """
+    retention_start = timezone.now() - timedelta(seconds=settings.DIGEST_FILE_RETENTION_SECONDS)
+    jobs = resumable_jobs(retention_start)
+    needed_files = set(jobs.values_list('file_path', flat=True))
+    needed_files.update(DigestChunk.objects.filter(job__in=jobs).values_list('path', flat=True).distinct())
+
+    deleted_files = 0
+    if not os.path.isdir(settings.DIGEST_DATA_DIR):
+        return deleted_files
+    for entry in os.scandir(settings.DIGEST_DATA_DIR):
+        if (
+            entry.is_file()
+            and entry.path not in needed_files
+            and entry.stat().st_mtime < retention_start.timestamp()
+        ):
+            os.remove(entry.path)
+            deleted_files += 1
+    return deleted_files
 
 
 @shared_task
-def sum_reports(reports, send_email=False):
+def sum_reports(reports, send_email=False, error_report_url=None):
     """
     Process the reports from each chunk and generate a summary report.
     """
+    started = time.perf_counter()
     summary_report = OrganizationDigestReport()
     for report in reports:
         summary_report.created += report['created']
         summary_report.updated += report['updated']
+        summary_report.unchanged += report['unchanged']
+        summary_report.duplicates += report['duplicates']
+        summary_report.deleted += report['deleted']
         summary_report.errors += report['errors']
-        summary_report.error_messages.extend(report['error_messages'])
+        summary_report.row_errors.extend(RowError(**row_error) for row_error in report['row_errors'])
 
     if send_email:
         print('Sending email...')
@@ -166,7 +591,17 @@ def sum_reports(reports, send_email=False):
     print('=== Summary report ===')
     print(f'Created: {summary_report.created}')
     print(f'Updated: {summary_report.updated}')
+    print(f'Unchanged: {summary_report.unchanged}')
+    print(f'Duplicates: {summary_report.duplicates}')
     print(f'Errors: {summary_report.errors}')
-    print('Error messages:')
-
+    if summary_report.deleted:
+        print(f'Deleted: {summary_report.deleted}')
+    if error_report_url:
+        print(f'Error report: {error_report_url}')
+    if summary_report.row_errors:
+        print('Error messages:')
+    for row_error in summary_report.row_errors:
+        print(f'- {row_error}')
+
+    DIGEST_STAGE_SECONDS.observe(time.perf_counter() - started, stage='report')
     return asdict(summary_report)
@@ -0,0 +1,363 @@
+# tests.py
+import csv
+import datetime
+import gzip
+import os
+import tempfile
+import zipfile
+from dataclasses import asdict
+from unittest import mock
+from django.db import transaction
+from django.test import TestCase
+
+from orgdigestor.benchmarks import BENCHMARK_HEADER, write_synthetic_csv
+from orgdigestor.chunking import plan_chunks
+from orgdigestor.ingestion import (
+    CSV_COLUMNS, DIGEST_BATCH_ROWS, OrganizationDigestReport, digest_validated_rows, merge_reports, upsert_organizations,
+)
+from orgdigestor.models import Country, DigestError, DigestJob, Industry, Organization
+from orgdigestor.snapshot import IncompleteSnapshot
+from orgdigestor.stats import organization_stats, refresh_organization_stats
+from orgdigestor.tasks import finish_digest_job, parse_chunk_batches, process_csv_chunk, start_digest_job
+
+
+def digest_file(file_path, **job_fields):
+    """
+    Digest a file like `digest_organizations` does, chunks one after the other and the job finished once they are done.
+    """
+    job = DigestJob.objects.create(file_path=file_path, **job_fields)
+    with mock.patch('builtins.print'):
+        for chunk_id in start_digest_job(job.id):
+            process_csv_chunk.apply((chunk_id,), {'scheduled': False}, throw=True)
+        finish_digest_job(job.id)
+    job.refresh_from_db()
+    return job
+
+
+class UpsertCountsTests(TestCase):
+    """
+    Created, updated and unchanged come from the upsert itself, and the stats rollup follows what it wrote.
+    """
+
+    def organization(self, organization_id, founded, employees):
+        return {
+            'id': organization_id, 'name': f'Organization {organization_id}', 'country': 'Upsertland',
+            'industry': 'Upserting', 'website': '', 'description': '', 'founded': founded,
+            'number_of_employees': employees,
+        }
+
+    def upsert(self, valid_rows):
+        digest_report = upsert_organizations(valid_rows, OrganizationDigestReport())
+        counts = (digest_report.created, digest_report.updated, digest_report.unchanged, digest_report.duplicates)
+        refresh_organization_stats()
+        stats = {
+            row['decade']: (row['total_organizations'], row['total_employees'])
+            for row in organization_stats(['decade'], country='Upsertland')
+        }
+        return counts, stats
+
+    def test_upsert_counts_and_stats(self):
+        batch = [
+            self.organization('U00000000000001', datetime.date(1995, 1, 1), 10),
+            self.organization('U00000000000002', datetime.date(2003, 5, 4), 20),
+            self.organization('U00000000000003', None, None),
+        ]
+        self.assertEqual(self.upsert(batch), ((3, 0, 0, 0), {1990: (1, 10), 2000: (1, 20), None: (1, 0)}))
+        self.assertEqual(self.upsert(batch), ((0, 0, 3, 0), {1990: (1, 10), 2000: (1, 20), None: (1, 0)}))
+
+        modified = [
+            self.organization('U00000000000001', datetime.date(2011, 1, 1), 10),
+            self.organization('U00000000000002', datetime.date(2003, 5, 4), 5),
+            self.organization('U00000000000002', datetime.date(2003, 5, 4), 25),
+            self.organization('U00000000000003', None, None),
+            self.organization('U00000000000004', datetime.date(1999, 1, 1), 1),
+        ]
+        self.assertEqual(
+            self.upsert(modified), ((1, 2, 1, 1), {1990: (1, 1), 2000: (1, 25), 2010: (1, 10), None: (1, 0)})
+        )
+
+
+class ParserParityTests(TestCase):
+    """
+    The columnar parser gives the same rows, reports and row errors as the Python one.
+    """
+    header = ','.join(CSV_COLUMNS).encode()
+    files = {
+        'quoted_newlines': b'\n'.join([
+            header,
+            b'100000000000001,"Multi\nline",Spain,Retail,https://example.com,"Windows\r\nnewline",1999,3',
+            b'100000000000002,"Quote ""inside""",Spain,Retail,,"Two\n\nblank lines",,',
+        ]) + b'\n',
+        'bom': b'\xef\xbb\xbf' + header + b'\n100000000000001,Bom,Spain,Retail,,,,\n',
+        'blank_founded': b'\n'.join([
+            header,
+            b'100000000000001,Empty,Spain,Retail,,,,',
+            b'100000000000002,Spaces,Spain,Retail,,,  ,',
+            b'100000000000003,Year,Spain,Retail,,,1999,',
+        ]) + b'\n',
+        'bad_urls': b'\n'.join([
+            header,
+            b'100000000000001,No scheme,Spain,Retail,example.com,,,',
+            b'100000000000002,Typo,Spain,Retail,htp:/example.com,,,',
+            b'100000000000003,Spaces,Spain,Retail,https://exa mple.com,,,',
+            b'100000000000004,Good,Spain,Retail,https://example.com/path?q=1,,,',
+        ]) + b'\n',
+        'not_utf8': b'\n'.join([
+            header,
+            b'100000000000001,Caf\xe9,Spain,Retail,,,,',
+            b'10000000000\xff02,Bad id,Spain,Retail,,,,',
+            b'100000000000003,Fine,Spain,Retail,,,,',
+        ]) + b'\n',
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def parse(self, file_path, parser):
+        """
+        Parsed batches and digest report of a file, the writes are rolled back.
+        """
+        batches, digest_report = [], OrganizationDigestReport()
+        with transaction.atomic():
+            for chunk in plan_chunks(file_path, 2):
+                first_row = chunk.first_row
+                for valid_rows, invalid_rows, rows in parse_chunk_batches(asdict(chunk), parser):
+                    batches.append((valid_rows, invalid_rows, rows))
+                    merge_reports(digest_report, digest_validated_rows(valid_rows, invalid_rows, first_row))
+                    first_row += rows
+            transaction.set_rollback(True)
+        return batches, digest_report
+
+    def test_parsers_agree(self):
+        for name, data in self.files.items():
+            with self.subTest(file=name):
+                file_path = os.path.join(self.directory, f'{name}.csv')
+                with open(file_path, mode='wb') as file:
+                    file.write(data)
+                self.assertEqual(self.parse(file_path, 'columnar'), self.parse(file_path, 'python'))
+
+    def test_rows_that_are_not_utf8_are_errors(self):
+        file_path = os.path.join(self.directory, 'not_utf8.csv')
+        with open(file_path, mode='wb') as file:
+            file.write(self.files['not_utf8'])
+        _, digest_report = self.parse(file_path, 'columnar')
+        self.assertEqual((digest_report.created, digest_report.errors), (1, 2))
+        self.assertEqual(
+            [(row_error.row_number, row_error.field) for row_error in digest_report.row_errors],
+            [(1, 'name'), (2, 'id')],
+        )
+
+
+class LoaderParityTests(TestCase):
+    """
+    Both loaders, with either parser, give the same verdict for every row of a file.
+    """
+    header = ','.join(CSV_COLUMNS)
+    records = [
+        '1000000000000AA,Valid,Spain,Retail,https://example.com,Shop,1999,10',
+        '1000000000000AB,Year and date,Spain,Retail,,,1999-1-2,',
+        '1000000000000AC,Padded , Spain ,Retail,  https://example.com/a  ,,  2001  , 7 ',
+        '1000000000000AD,"Quoted, with a\nnewline",Spain,Retail,,,,',
+        '1000000000000AE,Bad website,Spain,Retail,not a url,,,',
+        '1000000000000AF,Bad date,Spain,Retail,,,1999/01/02,',
+        '1000000000000AG,Bad employees,Spain,Retail,,,,1e3',
+        '1000000000000AH,Too many fields,Spain,Retail,,,,,extra',
+        '1000000000000AI,Too few fields,Spain',
+        '1000000000000AJ,Nul\x00name,Spain,Retail,,,,',
+        '1000000000000AK,\u00a0Odd space\u2003,Spain,Retail,,,,',
+        ',No id,Spain,Retail,,,,',
+        '1000000000000AA,Repeated,Spain,Retail,,,,',
+        '1000000000000AL,"Unterminated quote,Spain,Retail,,,,',
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file_path = os.path.join(directory.name, 'organizations.csv')
+        with open(self.file_path, mode='w', encoding='utf-8', newline='') as file:
+            file.write('\n'.join([self.header, *self.records]) + '\n')
+
+    def verdicts(self, loader, parser):
+        job = digest_file(self.file_path, loader=loader, parser=parser)
+        counts = {name: getattr(job, name) for name in (
+            'state', 'processed_rows', 'created', 'updated', 'unchanged', 'duplicates', 'errors',
+        )}
+        errors = list(DigestError.objects.filter(job=job).order_by('id').values_list(
+            'row_number', 'organization_id', 'field', 'message',
+        ))
+        organizations = list(Organization.objects.order_by('id').values())
+        Organization.objects.all().delete()
+        return counts, errors, organizations
+
+    def test_loaders_and_parsers_agree(self):
+        expected = self.verdicts('bulk', 'python')
+        self.assertEqual(expected[0]['state'], DigestJob.State.SUCCEEDED)
+        self.assertEqual(expected[0]['processed_rows'], len(self.records))
+        self.assertTrue(expected[0]['errors'])
+        for loader, parser in [('bulk', 'columnar'), ('copy', 'python'), ('copy', 'columnar')]:
+            with self.subTest(loader=loader, parser=parser):
+                self.assertEqual(self.verdicts(loader, parser), expected)
+
+
+class CrossChunkDuplicatesTests(TestCase):
+    """
+    Ids repeated in different chunks of a file are written once, by the occurrence the job's policy keeps.
+    """
+    records = [
+        '100000000000001,First A,Spain,Retail,,,,',
+        '100000000000002,First B,Spain,Retail,,,,',
+        '100000000000001,Second A,Spain,Retail,,,,',
+        '100000000000003,Only C,Spain,Retail,,,,',
+        '100000000000002,Second B,Spain,Retail,,,,',
+        '100000000000001,Third A,Spain,Retail,,,,',
+        '100000000000004,Only D,Spain,Retail,,,,',
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file_path = os.path.join(directory.name, 'organizations.csv')
+        with open(self.file_path, mode='w', encoding='utf-8', newline='') as file:
+            file.write('\n'.join([','.join(CSV_COLUMNS), *self.records]) + '\n')
+
+    def test_duplicates_across_chunks(self):
+        expected_names = {
+            'last': ['Third A', 'Second B', 'Only C', 'Only D'],
+            'first': ['First A', 'First B', 'Only C', 'Only D'],
+        }
+        for loader in ('bulk', 'copy'):
+            for policy, names in expected_names.items():
+                with self.subTest(loader=loader, policy=policy):
+                    job = digest_file(self.file_path, loader=loader, duplicate_policy=policy, rows_per_task=2)
+                    self.assertEqual(job.chunks.count(), 4)
+                    self.assertEqual(
+                        (job.state, job.processed_rows, job.created, job.duplicates, job.errors),
+                        (DigestJob.State.SUCCEEDED, 7, 4, 3, 0),
+                    )
+                    self.assertEqual(list(Organization.objects.order_by('id').values_list('name', flat=True)), names)
+                    Organization.objects.all().delete()
+
+
+class BlankLinesTests(TestCase):
+    """
+    Blank lines are neither planned nor digested as rows, so row numbers and totals match what the parsers read.
+    """
+
+    def test_blank_lines_are_not_rows(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        file_path = os.path.join(directory.name, 'organizations.csv')
+        with open(file_path, mode='wb') as file:
+            file.write(b''.join([
+                ','.join(CSV_COLUMNS).encode(), b'\n\n',
+                b'100000000000001,Valid,Spain,Retail,,,,\n\n\n',
+                b'100000000000002,Bad website,Spain,Retail,not a url,,,\n',
+                b'100000000000003,Valid,Spain,Retail,,,,\n\r\n',
+                b'100000000000004,Bad founded,Spain,Retail,,,someday,\n\n',
+            ]))
+
+        for loader, parser in [('bulk', 'python'), ('bulk', 'columnar'), ('copy', 'python')]:
+            with self.subTest(loader=loader, parser=parser):
+                job = digest_file(file_path, loader=loader, parser=parser, rows_per_task=2)
+                self.assertEqual(
+                    list(job.chunks.order_by('index').values_list('first_row', 'rows')), [(1, 2), (3, 2)]
+                )
+                self.assertEqual((job.total_rows, job.processed_rows, job.created, job.errors), (4, 4, 2, 2))
+                self.assertEqual(
+                    list(DigestError.objects.filter(job=job).order_by('row_number').values_list('row_number', 'field')),
+                    [(2, 'website'), (4, 'founded')],
+                )
+                Organization.objects.all().delete()
+
+
+class CompressedFilesTests(TestCase):
+    """
+    Gzipped files and ZIP members are decompressed once and cut into chunks like plain CSV files.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        data_dir = os.path.join(self.directory, 'data')
+        self.enterContext(self.settings(DIGEST_DATA_DIR=data_dir))
+        self.data = '\n'.join([','.join(CSV_COLUMNS), *(
+            f'{index:015},Organization {index},Spain,Retail,,,,' if index % 4 else f'{index:015},Bad,Spain,,,,,'
+            for index in range(1, 8)
+        )]).encode() + b'\n'
+
+    def test_gzipped_file(self):
+        file_path = os.path.join(self.directory, 'organizations.csv.gz')
+        with gzip.open(file_path, mode='wb') as file:
+            file.write(self.data)
+
+        job = digest_file(file_path, rows_per_task=2)
+
+        self.assertEqual(
+            list(job.chunks.values_list('first_row', 'rows').order_by('index')), [(1, 2), (3, 2), (5, 2), (7, 1)]
+        )
+        self.assertEqual((job.total_rows, job.processed_rows, job.created, job.errors), (7, 7, 6, 1))
+        self.assertEqual(list(DigestError.objects.filter(job=job).values_list('member', 'row_number')), [(None, 4)])
+
+    def test_zip_members(self):
+        file_path = os.path.join(self.directory, 'organizations.zip')
+        with zipfile.ZipFile(file_path, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('first.csv', self.data)
+            archive.writestr('second.csv', self.data.replace(b',Spain,', b',France,'))
+
+        job = digest_file(file_path, rows_per_task=4)
+
+        self.assertEqual(
+            list(job.chunks.values_list('member', 'first_row', 'rows').order_by('index')),
+            [('first.csv', 1, 4), ('first.csv', 5, 3), ('second.csv', 1, 4), ('second.csv', 5, 3)],
+        )
+        # The second member repeats the ids of the first one, whose rows are left out as duplicates
+        self.assertEqual((job.processed_rows, job.created, job.duplicates, job.errors), (14, 6, 7, 1))
+        self.assertEqual(set(Organization.objects.values_list('country__name', flat=True)), {'France'})
+        self.assertEqual(
+            list(DigestError.objects.filter(job=job).values_list('member', 'row_number')), [('second.csv', 4)]
+        )
+
+
+class CopySnapshotTests(TestCase):
+    """
+    Snapshot jobs of the "copy" loader, whose chunks span several batches of `DIGEST_BATCH_ROWS` rows.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        country = Country.objects.create(name='Nowhere')
+        industry = Industry.objects.create(name='Nothing')
+        self.kept = Organization.objects.create(id='0' * 15, name='Kept', country=country, industry=industry)
+        self.missing = Organization.objects.create(id='F' * 15, name='Missing', country=country, industry=industry)
+
+    def test_snapshot_keeps_the_organizations_of_the_file(self):
+        file_path = os.path.join(self.directory.name, 'organizations.csv')
+        rows = DIGEST_BATCH_ROWS * 2 + 500
+        write_synthetic_csv(file_path, rows, malformed_ratio=0)
+        with open(file_path, newline='') as file:
+            file_ids = {row['Organization Id'] for row in csv.DictReader(file)}
+
+        job = digest_file(file_path, loader='copy', mode='snapshot')
+
+        self.assertEqual(job.state, DigestJob.State.SUCCEEDED)
+        self.assertEqual(job.errors, 0)
+        self.assertEqual(job.duplicates, rows - len(file_ids))
+        self.assertEqual(set(Organization.objects.values_list('id', flat=True)), file_ids)
+        # The first id of the file is the one of the organization kept
+        self.assertEqual(job.deleted, 1)
+        self.assertFalse(Organization.objects.filter(pk=self.missing.pk).exists())
+
+    def test_snapshot_without_rows_deletes_nothing(self):
+        file_path = os.path.join(self.directory.name, 'header.csv')
+        with open(file_path, mode='w', newline='') as file:
+            csv.writer(file).writerow(BENCHMARK_HEADER)
+
+        with self.assertRaises(IncompleteSnapshot):
+            digest_file(file_path, loader='copy', mode='snapshot')
+
+        self.assertEqual(DigestJob.objects.get(file_path=file_path).state, DigestJob.State.FAILED)
+        self.assertEqual(Organization.objects.count(), 2)
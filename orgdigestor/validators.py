@@ -0,0 +1,176 @@
+# validators.py
+import re
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator, URLValidator
+from django.db import models
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ErrorDetail
+
+from orgdigestor.models import Organization
+
+# Same messages DRF gives for the fields `OrganizationSerializer` builds from the model
+NULL = ErrorDetail('This field may not be null.', code='null')
+BLANK = ErrorDetail('This field may not be blank.', code='blank')
+NULL_CHARACTERS = ErrorDetail('Null characters are not allowed.', code='null_characters_not_allowed')
+INVALID_STRING = ErrorDetail('Not a valid string.', code='invalid')
+INVALID_URL = ErrorDetail('Enter a valid URL.', code='invalid')
+INVALID_DATE = ErrorDetail('Date has wrong format. Use one of these formats instead: YYYY-MM-DD.', code='invalid')
+INVALID_INTEGER = ErrorDetail('A valid integer is required.', code='invalid')
+INTEGER_STRING_TOO_LARGE = ErrorDetail('String value too large.', code='max_string_length')
+
+SURROGATE_CHARACTERS = re.compile('[\ud800-\udfff]')
+INTEGER_DECIMALS = re.compile(r'\.0*\s*$')
+INTEGER_MAX_STRING_LENGTH = 1000
+
+url_validator = URLValidator()
+
+
+def char_rule(max_length=None, allow_blank=False, allow_null=False, url=False):
+    max_length_error = ErrorDetail(
+        f'Ensure this field has no more than {max_length} characters.', code='max_length'
+    )
+
+    def validate(value, errors):
+        if value is None:
+            if not allow_null:
+                errors.append(NULL)
+            return None
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            errors.append(INVALID_STRING)
+            return None
+
+        value = str(value).strip()
+        if value == '':
+            if not allow_blank:
+                errors.append(BLANK)
+            return ''
+
+        if max_length is not None and len(value) > max_length:
+            errors.append(max_length_error)
+        if '\x00' in value:
+            errors.append(NULL_CHARACTERS)
+        if surrogate := SURROGATE_CHARACTERS.search(value):
+            errors.append(ErrorDetail(
+                f'Surrogate characters are not allowed: U+{ord(surrogate.group()):X}.',
+                code='surrogate_characters_not_allowed'
+            ))
+        if url:
+            try:
+                url_validator(value)
+            except DjangoValidationError:
+                errors.append(INVALID_URL)
+        return value
+
+    return validate
+
+
+def date_rule(allow_null=False):
+    def validate(value, errors):
+        if value is None:
+            if not allow_null:
+                errors.append(NULL)
+            return None
+        # Year-only values are taken as January 1st, like `OrganizationSerializer` does
+        if isinstance(value, str) and len(value) == 4:
+            value += '-01-01'
+        try:
+            parsed = parse_date(value)
+        except (ValueError, TypeError):
+            parsed = None
+        if parsed is None:
+            errors.append(INVALID_DATE)
+        return parsed
+
+    return validate
+
+
+def integer_rule(min_value=None, max_value=None, allow_null=False):
+    max_value_error = ErrorDetail(f'Ensure this value is less than or equal to {max_value}.', code='max_value')
+    min_value_error = ErrorDetail(f'Ensure this value is greater than or equal to {min_value}.', code='min_value')
+
+    def validate(value, errors):
+        if value is None:
+            if not allow_null:
+                errors.append(NULL)
+            return None
+        if isinstance(value, str) and len(value) > INTEGER_MAX_STRING_LENGTH:
+            errors.append(INTEGER_STRING_TOO_LARGE)
+            return None
+        try:
+            value = int(INTEGER_DECIMALS.sub('', str(value)))
+        except (ValueError, TypeError):
+            errors.append(INVALID_INTEGER)
+            return None
+        if max_value is not None and value > max_value:
+            errors.append(max_value_error)
+        if min_value is not None and value < min_value:
+            errors.append(min_value_error)
+        return value
+
+    return validate
+
+
+def compile_rule(model_field):
+    """
+    Build the validation function of a model field, following the rules DRF derives for it.
+    Foreign keys are validated as the name of the related row, resolved afterwards in bulk.
+    """
+    if isinstance(model_field, models.ForeignKey):
+        name_field = model_field.related_model._meta.get_field('name')
+        return char_rule(name_field.max_length)
+    if isinstance(model_field, models.DateField):
+        return date_rule(allow_null=model_field.null)
+    if isinstance(model_field, models.IntegerField):
+        limits = {
+            'min_value': next((v.limit_value for v in model_field.validators if isinstance(v, MinValueValidator)), None),
+            'max_value': next((v.limit_value for v in model_field.validators if isinstance(v, MaxValueValidator)), None),
+        }
+        return integer_rule(allow_null=model_field.null, **limits)
+    if isinstance(model_field, (models.CharField, models.TextField)):
+        return char_rule(
+            model_field.max_length,
+            allow_blank=model_field.blank and not model_field.primary_key,
+            allow_null=model_field.null,
+            url=isinstance(model_field, models.URLField),
+        )
+    raise TypeError(f'No validation rule for {model_field!r}')
+
+
+class OrganizationRowValidator:
+    """
+    Schema driven validation of mapped CSV rows (see `map_org_row`), compiled once from the model.
+
+    It coerces values the same way `OrganizationSerializer` does and reports the same error messages,
+    without building a serializer per row nor querying the database.
+    """
+
+    def __init__(self, model=Organization, fields=(
+        'id', 'name', 'country', 'industry', 'website', 'description', 'founded', 'number_of_employees'
+    )):
+        self.rules = [(name, compile_rule(model._meta.get_field(name))) for name in fields]
+
+    def validate(self, data):
+        """
+        Return the coerced values of a row and its errors by field.
+        """
+        values, errors = {}, {}
+        for name, rule in self.rules:
+            field_errors = []
+            values[name] = rule(data.get(name), field_errors)
+            if field_errors:
+                errors[name] = field_errors
+        return values, errors
+
+    def validate_many(self, rows):
+        """
+        Validate a batch of rows, return the valid values and the (position, organization id, errors)
+        of the invalid rows.
+        """
+        valid_rows, invalid_rows = [], []
+        for position, data in enumerate(rows):
+            values, errors = self.validate(data)
+            if errors:
+                invalid_rows.append((position, values.get('id'), errors))
+            else:
+                valid_rows.append(values)
+        return valid_rows, invalid_rows